@@ -11,28 +11,66 @@ Architecture (sequential phases with concurrent test execution):
 The shared `runs` dict is updated throughout for live frontend polling.
 """
 
+import io
 import os
 import re
 import time
+import random
 import logging
 import requests
 import concurrent.futures
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
+from typing import Iterator
 from datetime import datetime, timezone
 
 from dotenv import load_dotenv
 
 from git_utils import clone_repo, create_branch, commit_changes, push_changes, get_all_files, cleanup_clone
-from docker_runner import run_tests
-from llm_client import generate_fix, explain_error, generate_tests_for_code
+from docker_runner import run_tests, run_tests_many, prepare_sandbox, release_sandbox, TestResult
+from llm_client import generate_fix, generate_fixes_tuple_batched, explain_error, generate_tests_for_code
 from results_generator import generate_results
+from state import append_terminal_output, run_lock
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 GITHUB_PAT = os.getenv("GITHUB_PAT", "")
 MAX_RETRIES = 5
-MAX_WORKERS = 4   # parallel test execution
+MAX_WORKERS = 4   # parallel LLM fix calls
+LINT_BATCH_MAX_BYTES = 8 * 1024   # lint-only files up to this size share batched fix prompts
+MAX_TEST_WORKERS = int(os.getenv("MAX_TEST_WORKERS", "8"))   # upper bound for parallel test execution
+
+# owner/repo from https://github.com/owner/repo(.git) or git@github.com:owner/repo(.git)
+_GH_URL_RE = re.compile(r"github\.com[:/]([^/]+)/([^/]+?)(?:\.git)?$")
+
+# Keep-alive session for GitHub API polls (one TLS handshake per host, not per poll)
+_GH_SESSION = requests.Session()
+_GH_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+))
+_GH_SESSION.headers.update({
+    "Authorization": f"token {GITHUB_PAT}",
+    "Accept": "application/vnd.github.v3+json",
+})
+
+# Commit messages for the six classified bug types (see docker_runner._classify_bug)
+_COMMIT_TEMPLATES = {
+    "LINTING": "Fix linting issue: {short}",
+    "SYNTAX": "Fix syntax error: {short}",
+    "LOGIC": "Fix logic bug: {short}",
+    "TYPE_ERROR": "Fix type error: {short}",
+    "IMPORT": "Fix import: {short}",
+    "INDENTATION": "Fix indentation: {short}",
+}
+
+# File discovery
+SOURCE_EXTENSIONS = (".py", ".js", ".ts", ".jsx", ".tsx")   # str.endswith-ready, stable order
+SCAN_EXTENSIONS = frozenset({"py", "js", "ts", "jsx", "tsx"})
+DISCOVERY_SKIP_DIRS = frozenset({".git", "__pycache__", ".tox", "node_modules", ".venv", "venv", "dist", "build"})
 
 
 # ---------------------------------------------------------------------------
@@ -59,9 +97,11 @@ def run_pipeline(
     repo = None
 
     def update_live(phase: str | None = None, message: str | None = None, append_terminal: str | None = None):
-        if phase: live["phase"] = phase
-        if message: live["message"] = message
-        if append_terminal: live["terminal_output"] += append_terminal
+        with run_lock(run_id):
+            if phase: live["phase"] = phase
+            if message: live["message"] = message
+        if append_terminal:
+            append_terminal_output(run_id, append_terminal)
         logger.info(f"[{run_id}] [{phase}] {message}")
 
     try:
@@ -69,11 +109,17 @@ def run_pipeline(
         # 1. DISCOVERY – clone & find tests
         # ---------------------------------------------------------------
         update_live("discovery", "Cloning repository…")
+        # Docker probe + runner image build overlap with the network-bound clone
+        prepare_sandbox()
         repo = clone_repo(repo_url, run_id, pat=GITHUB_PAT or None, team_name=team_name, leader_name=leader_name)
 
         # Populate file tree for Monaco editor
-        live["files"] = get_all_files(repo)
-        update_live("discovery", f"Cloned repo – {len(live['files'])} files indexed")
+        files = get_all_files(repo)
+        with run_lock(run_id):
+            live["files"] = files
+        # Slash-normalized path -> live file entry, for O(1) updates after fixes
+        files_by_path = {f["path"].replace("\\", "/"): f for f in files}
+        update_live("discovery", f"Cloned repo – {len(files)} files indexed")
 
         # Discover test files AND source files for comprehensive checking
         test_files = _discover_tests(repo.working_dir, include_source=True)
@@ -96,37 +142,41 @@ def run_pipeline(
         # 3. ITERATIVE HEAL LOOP (up to MAX_RETRIES)
         # ---------------------------------------------------------------
         final_status = "FAILED"
+        changed_files = None    # files touched by the last fix commit (None = unknown)
+        not_passing = set()     # test files that failed (or errored) in the last run
+
+        def run_and_collect(files: list[str]) -> tuple[list[dict], set[str]]:
+            """Run *files*, streaming output; return (failures, files not passing)."""
+            failures = []
+            failing = set(files)
+            for tf, result in _run_test_files(repo.working_dir, files):
+                # Stream output to the frontend as soon as each file finishes
+                # (a shared pytest session attaches its output to one file only)
+                if result.stdout or result.stderr:
+                    update_live(append_terminal=f"\n--- OUTPUT FOR {tf} ---\n{result.stdout}\n{result.stderr}\n")
+                if not result.passed:
+                    failures.extend(result.failures)
+                else:
+                    failing.discard(tf)
+            return failures, failing
 
         for iteration in range(1, MAX_RETRIES + 1):
             iter_start = datetime.now(timezone.utc)
+            # After the first pass, only re-run tests affected by the last fix commit
+            tests_to_run = test_files if iteration == 1 else _select_tests(test_files, changed_files, not_passing, files_by_path)
             update_live(
                 "execution",
-                f"Iteration {iteration}/{MAX_RETRIES} – running {len(test_files)} test file(s) in parallel…"
+                f"Iteration {iteration}/{MAX_RETRIES} – running {len(tests_to_run)} test file(s) in parallel…"
             )
-            update_live(append_terminal=f"\n>>> Running tests: {', '.join(test_files)}\n")
+            update_live(append_terminal=f"\n>>> Running tests: {', '.join(tests_to_run)}\n")
 
             # --- Parallel test execution ---
-            all_failures = []
-            output_blocks = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                future_to_file = {
-                    executor.submit(run_tests, repo.working_dir, tf): tf
-                    for tf in test_files
-                }
-                for future in concurrent.futures.as_completed(future_to_file):
-                    tf = future_to_file[future]
-                    try:
-                        result = future.result()
-                        # Capture output for frontend
-                        output_blocks.append(f"--- OUTPUT FOR {tf} ---\n{result.stdout}\n{result.stderr}\n")
-                        if not result.passed:
-                            all_failures.extend(result.failures)
-                    except Exception as exc:
-                        logger.exception(f"Test execution error for {tf}: {exc}")
-            
-            # Update live output
-            if output_blocks:
-                update_live(append_terminal="\n" + "\n".join(output_blocks) + "\n")
+            all_failures, not_passing = run_and_collect(tests_to_run)
+            if not all_failures and len(tests_to_run) < len(test_files):
+                # A passing subset is not a passing suite: confirm with every file
+                update_live("execution", f"Selected tests pass – confirming with all {len(test_files)} test file(s)…")
+                update_live(append_terminal=f"\n>>> Running tests: {', '.join(test_files)}\n")
+                all_failures, not_passing = run_and_collect(test_files)
 
             iter_status = "PASS" if not all_failures else "FAIL"
             ci_timeline.append({
@@ -136,7 +186,8 @@ def run_pipeline(
                 "failures_count": len(all_failures),
                 "message": f"{'All tests passed' if not all_failures else f'{len(all_failures)} failure(s) found'}",
             })
-            live["iterations"] = ci_timeline
+            with run_lock(run_id):
+                live["iterations"] = ci_timeline
 
             if not all_failures:
                 final_status = "PASSED"
@@ -144,46 +195,65 @@ def run_pipeline(
                 break
 
             # --- Diagnose & Fix ---
-            filtered_failures = []
-            for failure in all_failures:
-                err_msg = failure.get("error_message", "")
-                if err_msg and str(err_msg).strip() and str(err_msg).strip().lower() != "none":
-                    filtered_failures.append(failure)
-                else:
-                    update_live(append_terminal=f"\n[SKIP] Ignoring failure in {failure.get('file', 'unknown')} as it has no error description.\n")
-            
+            # run_tests normalizes empty / "none" error messages to None
+            filtered_failures = [f for f in all_failures if f.get("error_message")]
+            if len(filtered_failures) != len(all_failures):
+                for failure in all_failures:
+                    if not failure.get("error_message"):
+                        update_live(append_terminal=f"\n[SKIP] Ignoring failure in {failure.get('file', 'unknown')} as it has no error description.\n")
+
             all_failures = filtered_failures
 
             update_live("fixing", f"Found {len(all_failures)} valid failure(s) – applying LLM fixes…")
             fixed_files = []
+            changed_files = None
+
+            # Failures in distinct files are independent, so fix them concurrently.
+            # All failures of one file go into a single LLM call, so each file is
+            # written exactly once per iteration (no stale content, no write races).
+            failures_by_file = {}
+            for failure in all_failures:
+                failures_by_file.setdefault(failure.get("file", "").replace("\\", "/"), []).append(failure)
+            done_count = 0
 
-            for i, failure in enumerate(all_failures):
-                current_file = failure.get("file", "unknown")
-                update_live("fixing", f"Applying LLM fix {i+1}/{len(all_failures)}: {current_file}")
-                # Build a comprehensive project context by including the content of all indexed source files.
-                # This helps the AI fix cross-file logic errors and understand the full architecture.
-                project_context_parts = ["Full Project Source Code Context:"]
-                extensions = {".py", ".js", ".ts", ".jsx", ".tsx"}
-                # Use current in-memory content which reflects any fixes applied in this iteration so far
-                all_files_dict = {f["path"]: f for f in live.get("files", [])}
-                for path, f_data in all_files_dict.items():
-                    if f_data.get('type') == 'file' and any(path.lower().endswith(ext) for ext in extensions):
-                        project_context_parts.append(f"[[[ CONTEXT_FILE: {path} ]]]\n{f_data.get('content', '')}\n")
-
-                context_str = "\n".join(project_context_parts)
-
-                fix_entry = _apply_fix(repo.working_dir, failure, iteration, project_context=context_str)
-                all_fixes.append(fix_entry)
-                if fix_entry["status"] == "fixed":
-                    fixed_files.append(fix_entry["file"])
-                    # Update live files in memory for the Monaco editor
-                    for f in live.get("files", []):
-                        # Normalize slashes to ensure it matches
-                        if f["path"].replace("\\", "/") == fix_entry["file"].replace("\\", "/"):
-                            try:
-                                f["content"] = (Path(repo.working_dir) / f["path"]).read_text(encoding="utf-8", errors="replace")
-                            except Exception as e:
-                                logger.error(f"Failed to update live file content for {f['path']}: {e}")
+            # Small lint-only files share tuple-batched LLM calls instead of one call each
+            lint_groups = [g for g in failures_by_file.values() if _is_small_lint_group(repo.working_dir, g)]
+            if len(lint_groups) < 2:
+                lint_groups = []
+            other_groups = [g for g in failures_by_file.values() if not any(g is lg for lg in lint_groups)]
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                futures = [
+                    executor.submit(
+                        _apply_fix_multi, repo.working_dir, group, iteration,
+                        # Memoized: only rebuilt when the in-memory files changed
+                        _build_project_context(live.get("files", []), group[0].get("file", "")),
+                    )
+                    for group in other_groups
+                ]
+                batch_future = executor.submit(_apply_lint_batch, repo.working_dir, lint_groups, iteration) if lint_groups else None
+                if batch_future is not None:
+                    futures.append(batch_future)
+                for future in concurrent.futures.as_completed(futures):
+                    # The lint batch returns one entry list per file
+                    for fix_entries in (future.result() if future is batch_future else [future.result()]):
+                        done_count += len(fix_entries)
+                        update_live("fixing", f"Applied LLM fix {done_count}/{len(all_failures)}: {fix_entries[0]['file'] or 'unknown'}")
+                        # The fixed code is already on disk; keep it out of results.json
+                        new_content = fix_entries[0].get("new_content")
+                        for fix_entry in fix_entries:
+                            fix_entry.pop("new_content", None)
+                        all_fixes.extend(fix_entries)
+                        fix_entry = fix_entries[0]
+                        if fix_entry["status"] == "fixed":
+                            fixed_files.append(fix_entry["file"])
+                            # Update live files in memory for the Monaco editor (no disk re-read needed)
+                            live_file = files_by_path.get(fix_entry["file"].replace("\\", "/"))
+                            if live_file is not None:
+                                with run_lock(run_id):
+                                    # Keep the pre-fix text for the diff view, first fix only
+                                    live_file.setdefault("original_content", live_file["content"])
+                                    live_file["content"] = new_content
 
             # Re-enable local commits for fixed files (per user request: separate commit and push)
             if fixed_files:
@@ -191,13 +261,21 @@ def run_pipeline(
                 for f in fixed_files:
                     update_live(append_terminal=f"\n[WRITE] Fixed {f}\n")
                 
+                committed = False
                 try:
                     commit_msg = f"Fixed issues in: {', '.join(fixed_files)}"
                     sha = commit_changes(repo, [], commit_msg)
                     update_live("fixing", f"✅ Committed locally: {sha}. Remember to push to GitHub if desired.")
                     commit_count += 1
+                    committed = True
                 except Exception as e:
                     logger.error(f"Local commit failed: {e}")
+                if committed:
+                    try:
+                        changed_files = repo.git.diff("HEAD~1", "HEAD", "--name-only").splitlines()
+                    except Exception as e:
+                        # e.g. no HEAD~1 in a single-commit shallow clone; the next run covers every test
+                        logger.warning(f"Could not list files changed by the fix commit: {e}")
                 
                 # Push is handled separately or prompted in UI
                 push_success = False 
@@ -246,7 +324,221 @@ def run_pipeline(
         # The user wants to download the fixed code, so we skip cleanup for now.
         # Cleanups should be handled by a separate background task or periodic check.
         logger.info(f"[{run_id}] Skipping cleanup to allow for download.")
-        pass
+        # The sandbox container is not needed once the run ends; later test runs restart it
+        if repo is not None:
+            release_sandbox(repo.working_dir)
+
+
+# ---------------------------------------------------------------------------
+# Sub-agent: Test execution
+# ---------------------------------------------------------------------------
+
+def _run_test_files(repo_dir: str, test_files: list[str]) -> Iterator[tuple[str, TestResult]]:
+    """
+    Run *test_files* and yield (test_file, result) pairs.
+    A single file is run inline; more go through run_tests_many, which runs all
+    pytest files in one session and shards the rest across worker threads.
+    Files whose runner raised are logged and skipped.
+    """
+    if len(test_files) == 1:
+        tf = test_files[0]
+        try:
+            yield tf, run_tests(repo_dir, tf)
+        except Exception as exc:
+            logger.exception(f"Test execution error for {tf}: {exc}")
+        return
+
+    for result in run_tests_many(repo_dir, test_files, max_workers=_test_workers(len(test_files))):
+        yield result.test_file, result
+
+
+def _select_tests(test_files: list[str], changed_files: list[str] | None, not_passing: set[str], files_by_path: dict[str, dict]) -> list[str]:
+    """
+    Pick the test files worth re-running after a fix commit: the changed files
+    themselves, files that import a changed module, and anything not yet passing.
+    Falls back to the full set when the change set is unknown or nothing matches.
+    """
+    if not changed_files:
+        return test_files
+    changed = set(changed_files)
+    changed_stems = {p.rsplit("/", 1)[-1].split(".")[0] for p in changed_files}
+
+    selected = []
+    for tf in test_files:
+        if tf in changed or tf in not_passing:
+            selected.append(tf)
+            continue
+        live_file = files_by_path.get(tf)
+        if live_file is None:
+            # Not indexed (binary, unreadable, new) – can't rule it out
+            selected.append(tf)
+            continue
+        imports, _ = _file_facts(tf, live_file.get("content", ""))
+        if imports & changed_stems:
+            selected.append(tf)
+    return selected or test_files
+
+
+def _test_workers(n_files: int) -> int:
+    """Size the test pool to min(files, CPUs, cgroup CPU quota, MAX_TEST_WORKERS)."""
+    limit = min(n_files, os.cpu_count() or 2, MAX_TEST_WORKERS)
+    quota = _cgroup_cpu_limit()
+    if quota:
+        limit = min(limit, quota)
+    return max(1, limit)
+
+
+def _cgroup_cpu_limit() -> int | None:
+    """Return the container CPU quota (cgroup v2 cpu.max) rounded up, or None if unlimited."""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        if quota == "max":
+            return None
+        return max(1, -(-int(quota) // int(period)))
+    except (OSError, ValueError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Project context (shared across fix calls)
+# ---------------------------------------------------------------------------
+
+CONTEXT_TOKEN_BUDGET = 8000          # approx. tokens of reference files sent per fix
+MAX_CONTEXT_FILE_CHARS = 64 * 1024   # per-file cap before a file enters any context
+
+_IMPORT_RE = re.compile(
+    r"^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))"          # Python
+    r"|(?:import|require)\s*\(?[^'\"\n]*['\"]([^'\"\n]+)['\"]",      # JS/TS
+    re.MULTILINE,
+)
+_SYMBOL_RE = re.compile(
+    r"^(?:async\s+)?(?:def|class)\s+(\w+)"                                   # Python
+    r"|^(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function|class|const|let)\s+(\w+)",  # JS/TS
+    re.MULTILINE,
+)
+_IDENT_RE = re.compile(r"\w+")
+
+# (path, content hash) -> (imported module names, top-level symbols)
+_file_facts_cache: dict[tuple[str, int], tuple[frozenset, frozenset]] = {}
+# (target, budget, fingerprint) -> context_str
+_context_cache: dict[tuple, str] = {}
+
+
+def _truncate_for_context(content: str) -> str:
+    """Cap a single file at MAX_CONTEXT_FILE_CHARS, leaving a marker with the dropped size."""
+    if len(content) <= MAX_CONTEXT_FILE_CHARS:
+        return content
+    dropped = len(content) - MAX_CONTEXT_FILE_CHARS
+    return f"{content[:MAX_CONTEXT_FILE_CHARS]}\n[...truncated {dropped} chars...]"
+
+
+def _file_facts(path: str, content: str) -> tuple[frozenset, frozenset]:
+    """Return (imported module basenames, top-level symbols) for a source file, memoized."""
+    key = (path, hash(content))
+    facts = _file_facts_cache.get(key)
+    if facts is None:
+        imports = set()
+        for m in _IMPORT_RE.finditer(content):
+            name = m.group(1) or m.group(2) or m.group(3)
+            # Keep the last component: "pkg.utils" -> "utils", "./lib/utils.js" -> "utils"
+            name = name.replace("\\", "/").rstrip("/").split("/")[-1]
+            imports.add(name.split(".")[-1] if m.group(3) is None else name.split(".")[0])
+        symbols = {a or b for a, b in _SYMBOL_RE.findall(content)}
+        facts = (frozenset(imports), frozenset(symbols))
+        if len(_file_facts_cache) >= 4096:
+            _file_facts_cache.clear()
+        _file_facts_cache[key] = facts
+    return facts
+
+
+def _select_context(files: list[dict], target_file: str, budget_tokens: int = CONTEXT_TOKEN_BUDGET) -> list[tuple[str, str]]:
+    """
+    Pick the reference files most relevant to *target_file* within *budget_tokens*.
+    Scores each source file by import proximity (either direction), shared top-level
+    symbols, common directory prefix and whether it was modified during this run,
+    then greedily packs the highest scores. Tokens are approximated as len(content) // 4.
+    Returns (path, content) pairs in path order so equal selections render identically.
+    """
+    target = target_file.replace("\\", "/")
+    target_parts = target.split("/")
+    target_stem = target_parts[-1].split(".")[0]
+    target_content = ""
+    candidates = []
+    for f in files:
+        path = f["path"].replace("\\", "/")
+        content = f.get("content", "")
+        if path == target:
+            target_content = content
+        elif f.get("type", "file") == "file" and content and path.lower().endswith(SOURCE_EXTENSIONS):
+            candidates.append((path, f, _truncate_for_context(content)))
+
+    target_imports, _ = _file_facts(target, target_content)
+    target_idents = set(_IDENT_RE.findall(target_content)) if target_content else set()
+
+    scored = []
+    for path, f, content in candidates:
+        parts = path.split("/")
+        stem = parts[-1].split(".")[0]
+        imports, symbols = _file_facts(path, content)
+        score = 0.0
+        # (a) dependency proximity
+        if stem in target_imports:
+            score += 10
+        if target_stem in imports:
+            score += 6
+        # (b) shared top-level symbols
+        score += min(len(symbols & target_idents), 10)
+        # (c) path prefix overlap
+        common = 0
+        for a, b in zip(parts[:-1], target_parts[:-1]):
+            if a != b:
+                break
+            common += 1
+        score += common
+        # (d) recency: already touched by a fix in this run
+        if "original_content" in f:
+            score += 2
+        scored.append((score, path, content))
+
+    scored.sort(key=lambda x: (-x[0], len(x[2])))
+    selected = []
+    remaining = budget_tokens
+    for _score, path, content in scored:
+        cost = len(content) // 4 + 1
+        if cost <= remaining:
+            selected.append((path, content))
+            remaining -= cost
+    selected.sort()
+    return selected
+
+
+def _build_project_context(files: list[dict], target_file: str, budget_tokens: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Build a token-budgeted, relevance-ranked project context for a fix of *target_file*.
+    This helps the AI fix cross-file logic errors without shipping the whole repo.
+    The result is memoized on (target, path, content hash) so repeated fixes of the same
+    file reuse the same string until a fix actually changes something.
+    """
+    # Use current in-memory content which reflects any fixes applied in this iteration so far
+    # str hashes are cached on the object, so this is cheap for unchanged contents
+    fingerprint = tuple((f["path"], hash(f.get("content", ""))) for f in files)
+    key = (target_file, budget_tokens, fingerprint)
+    cached = _context_cache.get(key)
+    if cached is not None:
+        return cached
+
+    buf = io.StringIO()
+    buf.write("Full Project Source Code Context:")
+    for path, content in _select_context(files, target_file, budget_tokens):
+        buf.write(f"\n[[[ CONTEXT_FILE: {path} ]]]\n")
+        buf.write(content)
+        buf.write("\n")
+
+    context_str = buf.getvalue()
+    if len(_context_cache) >= 64:
+        _context_cache.clear()
+    _context_cache[key] = context_str
+    return context_str
 
 
 # ---------------------------------------------------------------------------
@@ -259,24 +551,45 @@ def _discover_tests(repo_dir: str, include_source: bool = False) -> list[str]:
     If include_source=True, also includes all .py, .js, .ts files for scanning.
     Returns relative paths.
     """
-    root = Path(repo_dir)
+    root = os.path.abspath(repo_dir)
+    prefix_len = len(root) + 1
     test_files = []
-    skip = {".git", "__pycache__", ".tox", "node_modules", ".venv", "venv", "dist", "build"}
-    
-    # Python files
-    for p in root.rglob("*.py"):
-        if any(s in p.parts for s in skip): continue
-        if include_source or p.stem.startswith("test_") or p.stem.endswith("_test"):
-            test_files.append(str(p.relative_to(root)).replace("\\", "/"))
-            
-    # JS/TS files
-    for ext in ("*.js", "*.ts", "*.jsx", "*.tsx"):
-        for p in root.rglob(ext):
-            if any(s in p.parts for s in skip): continue
-            if include_source or ".test." in p.name or ".spec." in p.name:
-                test_files.append(str(p.relative_to(root)).replace("\\", "/"))
-                
-    return list(set(test_files)) # deduplicate just in case
+
+    # Single walk; skipped directories are pruned before we descend into them
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            name = entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if name not in DISCOVERY_SKIP_DIRS:
+                        stack.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            stem, _, ext = name.rpartition(".")
+            if not stem or ext not in SCAN_EXTENSIONS:
+                continue
+            if ext == "py":
+                # Python files
+                is_test = stem.startswith("test_") or stem.endswith("_test")
+            else:
+                # JS/TS files
+                is_test = ".test." in name or ".spec." in name
+            if include_source or is_test:
+                test_files.append(entry.path[prefix_len:].replace("\\", "/"))
+
+    # Each path is yielded once by the walk; sort for a stable run order and prompt content
+    return sorted(test_files)
 
 
 def _generate_tests(repo_dir: str, files: list[dict]) -> list[str]:
@@ -286,12 +599,11 @@ def _generate_tests(repo_dir: str, files: list[dict]) -> list[str]:
     """
     # Score all files and pick top candidates
     scored_files = []
-    extensions = {".py", ".js", ".ts", ".jsx", ".tsx"}
-    
+
     for f in files:
         path = f["path"]
-        ext = Path(path).suffix.lower()
-        if ext in extensions and "test" not in path.lower() and "spec" not in path.lower() and "setup" not in path.lower():
+        path_lower = path.lower()
+        if path_lower.endswith(SOURCE_EXTENSIONS) and "test" not in path_lower and "spec" not in path_lower and "setup" not in path_lower:
             content = f.get("content", "")
             score = len(content)
             if "src/" in path or "lib/" in path:
@@ -310,15 +622,17 @@ def _generate_tests(repo_dir: str, files: list[dict]) -> list[str]:
     
     # Build a comprehensive project context by including the content of all indexed files.
     # This fulfills the user request to "pass all the code to the api".
-    project_context_parts = ["Full Project Source Code Context:"]
+    buf = io.StringIO()
+    buf.write("Full Project Source Code Context:")
     for f in files:
         path = f["path"]
-        content = f.get("content", "")
         # Only include source files to keep context manageable but comprehensive
-        if path.lower().endswith(tuple(extensions)):
-            project_context_parts.append(f"--- File: {path} ---\n{content}\n")
-    
-    project_context = "\n".join(project_context_parts)
+        if path.lower().endswith(SOURCE_EXTENSIONS):
+            buf.write(f"\n--- File: {path} ---\n")
+            buf.write(_truncate_for_context(f.get("content", "")))
+            buf.write("\n")
+
+    project_context = buf.getvalue()
     
     lang_map = {".py": "Python", ".js": "JavaScript", ".ts": "TypeScript", ".jsx": "JavaScript (React)", ".tsx": "TypeScript (React)"}
 
@@ -349,7 +663,84 @@ def _generate_tests(repo_dir: str, files: list[dict]) -> list[str]:
 # Sub-agent: Fix
 # ---------------------------------------------------------------------------
 
-def _apply_fix(repo_dir: str, failure: dict, iteration: int, project_context: str = "") -> dict:
+def _apply_fix_multi(repo_dir: str, failures: list[dict], iteration: int, project_context: str = "", fixed_code: str | None = None) -> list[dict]:
+    """
+    Fix every failure of one file with a single LLM call.
+    Returns one fix_entry per failure, all sharing the same status and commit message.
+    *fixed_code*, if given, is used instead of calling the LLM (see _apply_lint_batch).
+    """
+    if len(failures) == 1:
+        return [_apply_fix(repo_dir, failures[0], iteration, project_context, fixed_code)]
+
+    shared = _apply_fix(repo_dir, _combine_failures(failures), iteration, project_context, fixed_code)
+
+    entries = []
+    for failure in failures:
+        entry = dict(shared)
+        entry.update(
+            bug_type=failure.get("bug_type", "LOGIC"),
+            line=failure.get("line", 0),
+            error_message=failure.get("error_message", ""),
+        )
+        entries.append(entry)
+    return entries
+
+
+def _combine_failures(failures: list[dict]) -> dict:
+    """Merge all failures of one file into a single failure dict for one LLM prompt."""
+    if len(failures) == 1:
+        return failures[0]
+    bug_types = list(dict.fromkeys(f.get("bug_type", "LOGIC") for f in failures))
+    return {
+        "file": failures[0].get("file", ""),
+        "line": failures[0].get("line", 0),
+        "bug_type": " / ".join(bug_types),
+        "error_message": "\n".join(
+            f"Line {f.get('line', 0)} ({f.get('bug_type', 'LOGIC')}): {f.get('error_message', '')}"
+            for f in failures
+        ),
+    }
+
+
+def _is_small_lint_group(repo_dir: str, failures: list[dict]) -> bool:
+    """True if every failure is LINTING and the file is small enough for a shared batch prompt."""
+    if any(f.get("bug_type") != "LINTING" for f in failures):
+        return False
+    try:
+        return (Path(repo_dir) / failures[0].get("file", "")).stat().st_size <= LINT_BATCH_MAX_BYTES
+    except OSError:
+        return False
+
+
+def _apply_lint_batch(repo_dir: str, groups: list[list[dict]], iteration: int) -> list[list[dict]]:
+    """
+    Fix several small lint-only files with tuple-batched LLM calls
+    (llm_client.generate_fixes_tuple_batched), then write each result like
+    _apply_fix_multi. Returns one entry list per group.
+    """
+    jobs = []
+    for group in groups:
+        combined = _combine_failures(group)
+        try:
+            original_code = (Path(repo_dir) / combined["file"]).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            original_code = ""
+        jobs.append({
+            "bug_type": combined.get("bug_type", "LINTING"),
+            "file_path": combined.get("file", ""),
+            "line_number": combined.get("line", 0),
+            "error_message": combined.get("error_message", ""),
+            "original_code": original_code,
+        })
+    try:
+        fixed = generate_fixes_tuple_batched(jobs)
+    except Exception as exc:
+        logger.exception(f"Batched lint fixes failed, fixing one by one: {exc}")
+        fixed = [None] * len(groups)
+    return [_apply_fix_multi(repo_dir, group, iteration, fixed_code=code) for group, code in zip(groups, fixed)]
+
+
+def _apply_fix(repo_dir: str, failure: dict, iteration: int, project_context: str = "", fixed_code: str | None = None) -> dict:
     """
     Apply an LLM-generated fix to the failing file.
     Returns a fix_entry dict for the results table.
@@ -386,21 +777,25 @@ def _apply_fix(repo_dir: str, failure: dict, iteration: int, project_context: st
         else:
             logger.info(f"File {src_file} does not exist. Agent will attempt to create it.")
 
-        fixed_code = generate_fix(
-            bug_type=bug_type,
-            file_path=src_file,
-            line_number=line_no,
-            error_message=error_msg,
-            original_code=original_code,
-            project_context=project_context,
-        )
+        if fixed_code is None:
+            fixed_code = generate_fix(
+                bug_type=bug_type,
+                file_path=src_file,
+                line_number=line_no,
+                error_message=error_msg,
+                original_code=original_code,
+                project_context=project_context,
+            )
 
-        if fixed_code and (fixed_code != original_code or not full_p.exists()):
+        # "" is a real result (e.g. _local_fix removed a file's only line); the LLM paths
+        # return the original code instead of a blank answer
+        if fixed_code is not None and (fixed_code != original_code or (fixed_code and not full_p.exists())):
             full_p.parent.mkdir(parents=True, exist_ok=True)
             full_p.write_text(fixed_code, encoding="utf-8")
-            commit_msg = explain_error(bug_type, error_msg)
+            commit_msg = _commit_message(bug_type, error_msg)
             fix_entry["commit_message"] = commit_msg
             fix_entry["status"] = "fixed"
+            fix_entry["new_content"] = fixed_code
             logger.info(f"Fixed {src_file}:{line_no} ({bug_type})")
         else:
             logger.warning(f"LLM returned same code for {src_file} – no change applied")
@@ -412,51 +807,70 @@ def _apply_fix(repo_dir: str, failure: dict, iteration: int, project_context: st
     return fix_entry
 
 
+def _commit_message(bug_type: str, error_msg: str) -> str:
+    """Template a commit message for known bug types; only ask the LLM for anything else."""
+    template = _COMMIT_TEMPLATES.get(bug_type)
+    if template is None:
+        return explain_error(bug_type, error_msg)
+    lines = (error_msg or "").strip().splitlines()
+    return template.format(short=lines[0] if lines else bug_type.lower())[:72]
+
+
 # ---------------------------------------------------------------------------
 # Sub-agent: GitHub CI Polling
 # ---------------------------------------------------------------------------
 
-def _poll_github_ci(repo_url: str, branch: str, max_polls: int = 10, interval: int = 15) -> str:
+def _poll_github_ci(repo_url: str, branch: str, max_polls: int = 10, max_interval: int = 60) -> str:
     """
     Poll GitHub Checks API for the latest CI status on *branch*.
     Returns 'success', 'failure', 'pending', or 'unknown'.
     Requires GITHUB_PAT with repo scope.
+
+    Uses ETag conditional requests (a 304 is free against the primary rate limit)
+    and exponential backoff with jitter, capped at *max_interval* seconds.
     """
     # Parse owner/repo from URL
-    match = re.search(r"github\.com[:/](.+?)/(.+?)(?:\.git)?$", repo_url)
+    match = _GH_URL_RE.search(repo_url)
     if not match:
         return "unknown"
     owner, repo_name = match.group(1), match.group(2)
 
-    headers = {
-        "Authorization": f"token {GITHUB_PAT}",
-        "Accept": "application/vnd.github.v3+json",
-    }
     url = f"https://api.github.com/repos/{owner}/{repo_name}/commits/{branch}/check-runs"
+    etag = None
 
-    for _ in range(max_polls):
+    for attempt in range(max_polls):
+        delay = min(max_interval, 2 ** (attempt + 1) + random.uniform(0, 1))
         try:
-            resp = requests.get(url, headers=headers, timeout=10)
-            if resp.status_code == 200:
+            resp = _GH_SESSION.get(url, headers={"If-None-Match": etag} if etag else None, timeout=10)
+            if resp.status_code == 304:
+                pass  # Unchanged since the last poll – keep waiting
+            elif resp.status_code == 200:
+                etag = resp.headers.get("ETag") or etag
                 data = resp.json()
                 runs = data.get("check_runs", [])
-                if not runs:
-                    time.sleep(interval)
-                    continue
                 statuses = [r["conclusion"] for r in runs if r.get("conclusion")]
                 if "failure" in statuses:
                     return "failure"
                 if all(s == "success" for s in statuses) and statuses:
                     return "success"
-                time.sleep(interval)
-            elif resp.status_code in (401, 403):
+            elif resp.status_code in (401, 403) and resp.headers.get("X-RateLimit-Remaining") != "0":
                 logger.error(f"GitHub API Auth Failed (403). Check GITHUB_PAT permissions.")
                 return "auth_error"
-            else:
+            elif resp.status_code not in (403, 429):
                 break
+
+            # Honor the rate-limit reset instead of burning the remaining quota
+            remaining = resp.headers.get("X-RateLimit-Remaining")
+            if remaining is not None and int(remaining) < 5:
+                wait = int(resp.headers.get("X-RateLimit-Reset", "0")) - time.time()
+                if wait > max_interval:
+                    logger.warning(f"GitHub rate limit nearly exhausted; resets in {int(wait)}s – stopping CI poll.")
+                    break
+                delay = max(delay, wait)
         except Exception as exc:
             logger.warning(f"CI poll error: {exc}")
             break
+        time.sleep(delay)
 
     return "pending"
 
@@ -5,7 +5,7 @@ a = Analysis(
     ['run_backend.py'],
     pathex=[],
     binaries=[],
-    datas=[('.env.example', '.')],
+    datas=[('.env.example', '.'), ('images/pytest-runner/Dockerfile', 'images/pytest-runner')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -6,6 +6,21 @@ import json
 RUN_PATHS = {}
 CLONES_DIR = Path("cloned_repos") # Assumed sibling
 
+# run_id prefix -> clone dir, rebuilt only when CLONES_DIR's mtime changes
+_PREFIX_INDEX: dict[str, Path] = {}
+_PREFIX_INDEX_MTIME: float | None = None
+
+def _prefix_index() -> dict[str, Path]:
+    global _PREFIX_INDEX, _PREFIX_INDEX_MTIME
+    mtime = CLONES_DIR.stat().st_mtime
+    if mtime != _PREFIX_INDEX_MTIME:
+        index = {}
+        for item in CLONES_DIR.iterdir():
+            if item.is_dir() and not item.name.startswith("."):
+                index.setdefault(item.name.partition('_')[0], item)
+        _PREFIX_INDEX, _PREFIX_INDEX_MTIME = index, mtime
+    return _PREFIX_INDEX
+
 def get_repo_path(run_id: str) -> Path | None:
     if run_id in RUN_PATHS:
         return RUN_PATHS[run_id]
@@ -14,12 +29,7 @@ def get_repo_path(run_id: str) -> Path | None:
         return None
         
     try:
-        for item in CLONES_DIR.iterdir():
-            if item.is_dir():
-                prefix = item.name.split('_')[0]
-                if prefix == run_id:
-                    return item
-        return None
+        return _prefix_index().get(run_id)
     except Exception:
         return None
 
@@ -5,12 +5,25 @@ Falls back to running pytest directly (subprocess) if Docker is unavailable.
 """
 
 import os
+import re
+import mmap
+import atexit
+import concurrent.futures
+import functools
+import importlib.util
 import logging
+import shlex
+import shutil
+import socket
+import stat
 import sys
 import subprocess
 import tempfile
+import threading
+import time
+from collections import deque
 from pathlib import Path
-from typing import NamedTuple
+from typing import Iterator, NamedTuple
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +36,38 @@ class TestResult(NamedTuple):
     failures: list[dict]   # [{ file, line, error_message, bug_type }]
 
 
+TEST_TIMEOUT = 300          # seconds per test run (one file or one batched session)
+POOLED_KILL_GRACE = 5       # seconds after TEST_TIMEOUT before a pooled run is killed in-container
+OUTPUT_TAIL_LINES = 4096    # lines of runner output kept for display
+FAILURE_LINES_MAX = 4096    # traceback/summary lines kept for failure parsing
+
+
+# '❌' improvement markers, matched on raw UTF-8 bytes (first marker per line wins)
+_MARKER = "❌".encode("utf-8")
+_MARKER_RE = re.compile(re.escape(_MARKER) + rb"([^\n]*)")
+
+
+# Traceback patterns used by _parse_failures
+_TB_PY = re.compile(r'File "([^"]+?\.py)", line (\d+)')          # File "path.py", line 12
+_TB_SHORT = re.compile(r"^(?:E\s+)?(.+?\.py):(\d+): (.*)$")      # [E] path.py:12: message
+_TB_SKIP_PATHS = ("site-packages", ".venv")
+_SHORT_SKIP_PATHS = ("site-packages", ".venv", "AppData")
+# Exception names that mark the message line after a `File "...", line N` hit
+_ERROR_KEYWORDS_RE = re.compile(
+    r"SyntaxError|IndentationError|NameError|TypeError|AttributeError"
+    r"|ImportError|FileNotFoundError|ModuleNotFoundError"
+)
+
+# _classify_bug keywords, highest priority first
+_BUG_PATTERNS = [
+    ("INDENTATION", re.compile(r"indentation|unexpected indent", re.IGNORECASE)),
+    ("SYNTAX", re.compile(r"syntax|colon|missing", re.IGNORECASE)),
+    ("IMPORT", re.compile(r"importerror|modulenotfounderror|cannot import", re.IGNORECASE)),
+    ("TYPE_ERROR", re.compile(r"typeerror|type error|unsupported operand", re.IGNORECASE)),
+    ("LINTING", re.compile(r"flake8|pep8|lint|unused|import", re.IGNORECASE)),
+]
+
+
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
@@ -38,6 +83,11 @@ def run_tests(repo_path: str, test_file: str) -> TestResult:
         logger.warning("Docker not available – running tests locally (fallback)")
         res = _run_locally(repo_path, test_file)
 
+    return _with_markers(repo_path, test_file, res)
+
+
+def _with_markers(repo_path: str, test_file: str, res: TestResult) -> TestResult:
+    """Merge '❌' improvement markers from *test_file* into *res* and normalize its failures."""
     # NEW: Check for manually added improvement markers (e.g. # ❌ unused import)
     # This allows the agent to be proactive even if tests pass.
     markers = _check_custom_markers(repo_path, test_file)
@@ -51,51 +101,296 @@ def run_tests(repo_path: str, test_file: str) -> TestResult:
             if key not in seen:
                 seen.add(key)
                 unique.append(f)
-        return res._replace(passed=False, failures=unique)
+        return res._replace(passed=False, failures=_normalize_failures(unique))
+
+    return res._replace(failures=_normalize_failures(res.failures))
+
+
+def run_tests_many(repo_path: str, test_files: list[str], max_workers: int | None = None) -> list[TestResult]:
+    """
+    Run several pytest files in ONE pytest session (with xdist when available)
+    and split the outcome back into one TestResult per file, in input order.
+    Saves an interpreter + plugin startup per file. Non-pytest files (JS tests,
+    syntax checks) still go through run_tests_batch with *max_workers*.
+    """
+    py_tests = [tf for tf in test_files if _is_pytest_file(tf)]
+    if len(py_tests) < 2:
+        py_tests = []
+    py_set = set(py_tests)
+    others = [tf for tf in test_files if tf not in py_set]
+
+    by_file: dict[str, TestResult] = {}
+    if py_tests:
+        session = _run_pytest_session(repo_path, py_tests)
+        if session is None:
+            # Could not tell which file failed; fall back to one run per file
+            others = test_files
+        else:
+            by_file.update(session)
+    if others:
+        for res in run_tests_batch(repo_path, others, max_workers=max_workers):
+            by_file[res.test_file] = res
+    return [by_file[tf] for tf in test_files if tf in by_file]
+
+
+def _is_pytest_file(test_file: str) -> bool:
+    """True for files _run_locally / _run_in_docker would hand to pytest."""
+    name = test_file.lower()
+    return name.endswith(".py") and ("test" in name or "spec" in name)
+
+
+# Short test summary (-rfE): "FAILED tests/test_x.py::test_a - ..." / "ERROR tests/test_y.py - ..."
+_SUMMARY_RE = re.compile(r"^(?:FAILED|ERROR) (.+?\.py)(?:::| - |$)", re.MULTILINE)
+
+
+def _run_pytest_session(repo_path: str, test_files: list[str]) -> dict[str, TestResult] | None:
+    """
+    Run *test_files* with a single pytest invocation and demultiplex per file.
+    Returns None if the session failed in a way that cannot be attributed to files.
+    """
+    label = f"{len(test_files)} test files"
+    cmd, cwd = _pytest_session_cmd(repo_path, test_files)
+    logger.info(f"Running one pytest session for {label}")
+    # One TEST_TIMEOUT for the whole session: a hung test should reach the per-file
+    # fallback quickly, not after N x TEST_TIMEOUT
+    session = _execute_and_parse(label, cmd, cwd=cwd)
+
+    norm = {tf: tf.replace("\\", "/") for tf in test_files}
+
+    def _owner(path: str) -> str | None:
+        # Longest test path that the reported path ends with (handles /app/... and absolute paths)
+        path = path.replace("\\", "/")
+        best = None
+        for tf, n in norm.items():
+            if (path == n or path.endswith("/" + n)) and (best is None or len(n) > len(norm[best])):
+                best = tf
+        return best
+
+    summary: dict[str, str] = {}   # failed test file -> its first summary line
+    for m in _SUMMARY_RE.finditer(session.stdout):
+        tf = _owner(m.group(1))
+        if tf and tf not in summary:
+            line_end = session.stdout.find("\n", m.start())
+            summary[tf] = session.stdout[m.start():line_end if line_end >= 0 else None].strip()
+    failed = set(summary)
+    if session.stderr.startswith("Test run timed out"):
+        # Can't tell which file hung; the per-file runs time out (and are blamed) individually
+        logger.warning(f"pytest session for {label} timed out; re-running per file")
+        return None
+    if not session.passed and not failed:
+        logger.warning(f"Could not attribute pytest session failures for {label}; re-running per file")
+        return None
+    if "Interrupted:" in session.stdout:
+        # pytest stopped before running every file, so missing FAILED lines prove nothing
+        logger.warning(f"pytest session for {label} was interrupted; re-running per file")
+        return None
+
+    per_file: dict[str, list[dict]] = {tf: [] for tf in test_files}
+    first_failed = next((tf for tf in test_files if tf in failed), test_files[0])
+    for f in session.failures:
+        owner = _owner(f["file"])
+        if owner is None and f["file"] == label:
+            # Priority-2 fallback entries carry the node id in the message
+            m = _SUMMARY_RE.search(f["error_message"] or "")
+            owner = _owner(m.group(1)) if m else None
+            f = {**f, "file": owner or first_failed}
+        # Source-file failures can't be tied to one test; report them once
+        per_file[owner or first_failed].append(f)
+
+    for tf in failed:
+        if not per_file[tf] and tf in summary:
+            # e.g. a collection ERROR with no file:line of its own
+            per_file[tf].append({
+                "file": tf,
+                "line": 0,
+                "error_message": summary[tf],
+                "bug_type": _classify_bug(summary[tf]),
+            })
+
+    results = {}
+    for tf in test_files:
+        passed = tf not in failed and not per_file[tf]
+        # The whole session output is attached once, to the first file
+        stdout = session.stdout if tf == test_files[0] else ""
+        stderr = session.stderr if tf == test_files[0] else ""
+        res = TestResult(tf, passed, stdout, stderr, per_file[tf])
+        results[tf] = _with_markers(repo_path, tf, res)
+    return results
+
+
+def _pytest_session_cmd(repo_path: str, test_files: list[str]) -> tuple[list[str], str]:
+    """Build the (cmd, cwd) for one pytest run over *test_files*, in Docker or locally."""
+    # A collection error in one file must not stop the others from running
+    args = ["--tb=line", "-p", "no:cacheprovider", "-q", "-rfE", "--continue-on-collection-errors"]
+    if not _docker_available():
+        xdist = ["-n", "auto"] if importlib.util.find_spec("xdist") else []
+        return [sys.executable, "-m", "pytest", *test_files, *xdist, *args], repo_path
+
+    repo_path = str(Path(repo_path).resolve())
+    prebaked = _ensure_runner_image()
+    xdist = ["-n", "auto"] if prebaked else []   # pytest-xdist ships in RUNNER_IMAGE only
+    cid = _POOL.acquire(repo_path)
+    if cid:
+        cmd = _pooled_exec(cid, "python", "-m", "pytest", *test_files, *xdist, *args)
+    elif prebaked:
+        cmd = [
+            "docker", "run", "--rm",
+            "--network", "none",
+            "-v", f"{repo_path}:/app:ro",
+            "-w", "/app",
+            RUNNER_IMAGE,
+            "python", "-m", "pytest", *test_files, *xdist, *args,
+        ]
+    else:
+        cmd = [
+            "docker", "run", "--rm",
+            "--network", "none",
+            "-v", f"{repo_path}:/app:ro",
+            BASE_IMAGE,
+            "bash", "-c",
+            (
+                "pip install pytest --quiet 2>&1 | tail -3 && "
+                f"cd /app && python -m pytest {shlex.join(test_files)} "
+                f"{' '.join(args)} 2>&1"
+            ),
+        ]
+    return cmd, repo_path
+
+
+def prepare_sandbox() -> threading.Thread:
+    """
+    Probe Docker and make sure the pytest runner image exists on a background thread,
+    so the check (and a possible image build) overlaps with the clone.
+    Later run_tests calls wait on the same image lock rather than redoing the work.
+    """
+    def _warm():
+        if _docker_available():
+            _ensure_runner_image()
+
+    t = threading.Thread(target=_warm, name="sandbox-warmup", daemon=True)
+    t.start()
+    return t
+
+
+def _normalize_failures(failures: list[dict]) -> list[dict]:
+    """Set error_message to None when it is empty or the literal 'none', so callers can use a truthy check."""
+    for f in failures:
+        msg = f.get("error_message")
+        if msg is not None:
+            msg = str(msg).strip()
+            if not msg or msg.lower() == "none":
+                f["error_message"] = None
+    return failures
 
-    return res
+
+def run_tests_batch(repo_path: str, test_files: list[str], max_workers: int | None = None) -> Iterator[TestResult]:
+    """
+    Run many test files concurrently and yield their results in completion order.
+    Subprocess waits release the GIL, so a thread pool overlaps Docker/pytest startup.
+    Defaults to cpu_count - 2 workers (at least 1). Files whose runner raised are logged and skipped.
+    """
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 3) - 2)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_file = {
+            executor.submit(run_tests, repo_path, tf): tf
+            for tf in test_files
+        }
+        for future in concurrent.futures.as_completed(future_to_file):
+            tf = future_to_file[future]
+            try:
+                result = future.result()
+            except Exception as exc:
+                logger.exception(f"Test execution error for {tf}: {exc}")
+                continue
+            yield result
 
 
 def _check_custom_markers(repo_path: str, test_file: str) -> list[dict]:
-    """Scan a file for '❌' markers and report them as failures."""
-    failures = []
+    """Scan a file for '❌' markers and report them as failures (memoized per file version)."""
     full_path = Path(repo_path) / test_file
-    if not full_path.exists() or not full_path.is_file():
+    # Check file extension
+    if full_path.suffix.lower() not in (".py", ".js", ".ts", ".jsx", ".tsx"):
         return []
+    try:
+        st = full_path.stat()
+    except OSError:
+        return []
+    if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+        return []
+    # Fresh dicts each call: callers normalize failures in place
+    return [dict(f) for f in _scan_markers(str(full_path), test_file, st.st_mtime_ns, st.st_size)]
 
+
+@functools.lru_cache(maxsize=4096)
+def _scan_markers(full_path: str, test_file: str, mtime_ns: int, size: int) -> tuple[dict, ...]:
+    """Marker scan for one (path, mtime_ns, size) file version; an edit changes the key."""
+    failures = []
     try:
-        # Check file extension
-        ext = full_path.suffix.lower()
-        if ext not in (".py", ".js", ".ts", ".jsx", ".tsx"):
-            return []
-
-        content = full_path.read_text(encoding="utf-8", errors="replace")
-        lines = content.splitlines()
-        for i, line in enumerate(lines, 1):
-            if "❌" in line:
+        with open(full_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Most files have no marker: one memchr-speed scan, no decode
+            if mm.find(_MARKER) < 0:
+                return ()
+            line_no, cursor = 1, 0
+            for m in _MARKER_RE.finditer(mm):
+                # Count newlines incrementally since the previous marker
+                line_no += mm[cursor:m.start()].count(b"\n")
+                cursor = m.start()
                 # Extract message after the emoji
-                msg = line.split("❌", 1)[1].strip()
+                msg = m.group(1).decode("utf-8", errors="replace").strip()
                 # Classify based on the message
                 bug_type = _classify_bug(msg)
                 failures.append({
                     "file": test_file,
-                    "line": i,
+                    "line": line_no,
                     "error_message": f"Improvement item: {msg}",
                     "bug_type": bug_type
                 })
     except Exception as e:
         logger.warning(f"Failed to check markers in {test_file}: {e}")
     
-    return failures
+    return tuple(failures)
+
+
+DOCKER_CHECK_TTL = 60   # seconds a daemon probe result is trusted
+DOCKER_SOCKET = "/var/run/docker.sock"
+
+_docker_check_lock = threading.Lock()
+_docker_check: tuple[float, bool] | None = None   # (monotonic ts, available)
 
 
 def _docker_available() -> bool:
-    """Return True if the docker CLI is reachable."""
+    """Return True if the docker CLI and daemon are reachable (re-probed every DOCKER_CHECK_TTL s)."""
+    global _docker_check
+    with _docker_check_lock:
+        now = time.monotonic()
+        if _docker_check is not None and now - _docker_check[0] < DOCKER_CHECK_TTL:
+            return _docker_check[1]
+        available = _probe_docker()
+        _docker_check = (now, available)
+        return available
+
+
+def _probe_docker() -> bool:
+    """One uncached check for a docker CLI on PATH and a responsive daemon."""
+    if shutil.which("docker") is None:
+        return False
+    # Local daemon: a unix-socket connect is a sub-millisecond handshake
+    if os.name != "nt" and not os.environ.get("DOCKER_HOST") and os.path.exists(DOCKER_SOCKET):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(1)
+                sock.connect(DOCKER_SOCKET)
+            return True
+        except OSError:
+            return False
+    # Otherwise ask the daemon for its version only (much lighter than `docker info`)
     try:
         result = subprocess.run(
-            ["docker", "info"],
+            ["docker", "version", "--format", "{{.Server.Version}}"],
             capture_output=True,
-            timeout=10,
+            timeout=5,
         )
         return result.returncode == 0
     except Exception:
@@ -106,23 +401,183 @@ def _docker_available() -> bool:
 # Docker runner
 # ---------------------------------------------------------------------------
 
+BASE_IMAGE = "python:3.11-slim"
+RUNNER_IMAGE = "ai-agents/pytest-runner:3.11-xdist"   # BASE_IMAGE + pytest + pytest-xdist, see images/pytest-runner
+RUNNER_IMAGE_DIR = Path(__file__).parent / "images" / "pytest-runner"
+
+_image_lock = threading.Lock()
+_runner_image_ready: bool | None = None
+
+
+def _ensure_runner_image() -> bool:
+    """Return True if RUNNER_IMAGE exists locally, building it once per process if needed."""
+    global _runner_image_ready
+    with _image_lock:
+        if _runner_image_ready is None:
+            try:
+                inspect = subprocess.run(["docker", "image", "inspect", RUNNER_IMAGE], capture_output=True, timeout=30)
+                if inspect.returncode == 0:
+                    _runner_image_ready = True
+                else:
+                    logger.info(f"Building {RUNNER_IMAGE} from {RUNNER_IMAGE_DIR}")
+                    build = subprocess.run(
+                        ["docker", "build", "-t", RUNNER_IMAGE, str(RUNNER_IMAGE_DIR)],
+                        capture_output=True, text=True, timeout=600,
+                    )
+                    _runner_image_ready = build.returncode == 0
+                    if not _runner_image_ready:
+                        logger.warning(f"Could not build {RUNNER_IMAGE}, using {BASE_IMAGE}: {build.stderr.strip()[-500:]}")
+            except Exception as exc:
+                logger.warning(f"Could not prepare {RUNNER_IMAGE}, using {BASE_IMAGE}: {exc}")
+                _runner_image_ready = False
+        return _runner_image_ready
+
+
+class _ContainerPool:
+    """
+    One long-lived sandbox container per mounted repo, reused via `docker exec`.
+    Saves the container cold start and the pytest install on every test file.
+    Containers start outside the pool lock: the first caller for a repo owns a
+    Future that concurrent callers for the same repo wait on.
+    """
+
+    def __init__(self):
+        self._containers: dict[str, concurrent.futures.Future] = {}   # repo_path -> Future[container id]
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def acquire(self, repo_path: str) -> str | None:
+        """Return a running container id with *repo_path* mounted at /app, or None on failure."""
+        with self._lock:
+            fut = self._containers.get(repo_path)
+            owner = fut is None
+            if owner:
+                fut = self._containers[repo_path] = concurrent.futures.Future()
+        if not owner:
+            return fut.result()
+
+        cid = None
+        try:
+            cid = self._start(repo_path)
+        finally:
+            if cid is None:
+                # Drop the failed slot so a later call can retry
+                with self._lock:
+                    if self._containers.get(repo_path) is fut:
+                        del self._containers[repo_path]
+            fut.set_result(cid)
+        return cid
+
+    def _start(self, repo_path: str) -> str | None:
+        prebaked = _ensure_runner_image()
+        try:
+            proc = subprocess.run(
+                [
+                    "docker", "run", "-d",
+                    "--network", "none",          # no internet inside container
+                    "-v", f"{repo_path}:/app:ro", # read-only mount
+                    RUNNER_IMAGE if prebaked else BASE_IMAGE,
+                    "tail", "-f", "/dev/null",
+                ],
+                capture_output=True, text=True, timeout=60,
+            )
+            if proc.returncode != 0:
+                logger.warning(f"Could not start pooled container: {proc.stderr.strip()}")
+                return None
+            cid = proc.stdout.strip()
+            if not prebaked:
+                subprocess.run(
+                    ["docker", "exec", cid, "bash", "-c", "pip install pytest --quiet 2>&1 | tail -3"],
+                    capture_output=True, timeout=120,
+                )
+        except Exception as exc:
+            logger.warning(f"Could not start pooled container: {exc}")
+            return None
+        logger.info(f"Started pooled container {cid[:12]} for {repo_path}")
+        return cid
+
+    def release(self, repo_path: str) -> None:
+        """Remove the container for *repo_path* (e.g. when the clone goes away)."""
+        with self._lock:
+            fut = self._containers.pop(repo_path, None)
+        if fut is None:
+            return
+        # A container still starting is waited for, so it doesn't leak
+        cid = fut.result()
+        if cid:
+            try:
+                subprocess.run(["docker", "rm", "-f", cid], capture_output=True, timeout=30)
+            except Exception as exc:
+                logger.warning(f"Could not remove pooled container {cid[:12]}: {exc}")
+
+    def shutdown(self) -> None:
+        """Remove every pooled container; registered with atexit."""
+        with self._lock:
+            futs = list(self._containers.values())
+            self._containers.clear()
+        cids = [f.result() for f in futs if f.done() and f.result()]
+        if cids:
+            try:
+                subprocess.run(["docker", "rm", "-f", *cids], capture_output=True, timeout=30)
+            except Exception:
+                pass
+
+
+_POOL = _ContainerPool()
+
+
+def release_sandbox(repo_path: str) -> None:
+    """Stop the pooled test container for *repo_path*, if one is running."""
+    _POOL.release(str(Path(repo_path).resolve()))
+
+
+def _pooled_exec(cid: str, *argv: str) -> list[str]:
+    """
+    `docker exec` *argv* in pooled container *cid*. Killing the exec client on timeout
+    leaves the process running in the container, so coreutils `timeout` kills it there
+    shortly after _execute_and_parse has given up on it.
+    """
+    return [
+        "docker", "exec", "-w", "/app", cid,
+        "timeout", "-s", "KILL", str(TEST_TIMEOUT + POOLED_KILL_GRACE), *argv,
+    ]
+
+
 def _run_in_docker(repo_path: str, test_file: str) -> TestResult:
-    """Run pytest inside python:3.11-slim with the repo volume-mounted."""
+    """Run pytest inside a pooled pytest-runner container with the repo volume-mounted."""
     repo_path = str(Path(repo_path).resolve())
 
-    # Install deps then run pytest with JSON output
-    cmd = [
-        "docker", "run", "--rm",
-        "--network", "none",          # no internet inside container
-        "-v", f"{repo_path}:/app:ro", # read-only mount
-        "python:3.11-slim",
-        "bash", "-c",
-        (
-            "pip install pytest --quiet 2>&1 | tail -3 && "
-            f"cd /app && python -m pytest {test_file} "
-            "--tb=line -p no:cacheprovider -q 2>&1"
-        ),
-    ]
+    cid = _POOL.acquire(repo_path)
+    if cid:
+        cmd = _pooled_exec(
+            cid, "python", "-m", "pytest", test_file,
+            "--tb=line", "-p", "no:cacheprovider", "-q",
+        )
+    elif _ensure_runner_image():
+        # One-shot container from the pre-baked image
+        cmd = [
+            "docker", "run", "--rm",
+            "--network", "none",          # no internet inside container
+            "-v", f"{repo_path}:/app:ro", # read-only mount
+            "-w", "/app",
+            RUNNER_IMAGE,
+            "python", "-m", "pytest", test_file,
+            "--tb=line", "-p", "no:cacheprovider", "-q",
+        ]
+    else:
+        # One-shot container: install deps then run pytest
+        cmd = [
+            "docker", "run", "--rm",
+            "--network", "none",          # no internet inside container
+            "-v", f"{repo_path}:/app:ro", # read-only mount
+            BASE_IMAGE,
+            "bash", "-c",
+            (
+                "pip install pytest --quiet 2>&1 | tail -3 && "
+                f"cd /app && python -m pytest {test_file} "
+                "--tb=line -p no:cacheprovider -q 2>&1"
+            ),
+        ]
 
     return _execute_and_parse(test_file, cmd, cwd=repo_path)
 
@@ -131,6 +586,11 @@ def _run_in_docker(repo_path: str, test_file: str) -> TestResult:
 # Local subprocess fallback
 # ---------------------------------------------------------------------------
 
+# JS runners resolved once to absolute paths (npx.cmd, bun.exe, ... on Windows),
+# so the local fallback never needs a shell to find them
+_TOOLS = {name: shutil.which(name) or name for name in ("npx", "bun", "node")}
+
+
 def _run_locally(repo_path: str, test_file: str) -> TestResult:
     """Run tests or lint checks locally when Docker is unavailable."""
     ext = Path(test_file).suffix
@@ -145,12 +605,12 @@ def _run_locally(repo_path: str, test_file: str) -> TestResult:
     elif ext in (".js", ".ts", ".jsx", ".tsx"):
         if is_test:
             if os.path.exists(os.path.join(repo_path, "bun.lockb")):
-                cmd = ["bun", "test", test_file]
+                cmd = [_TOOLS["bun"], "test", test_file]
             else:
-                cmd = ["npx", "jest", test_file, "--passWithNoTests"]
+                cmd = [_TOOLS["npx"], "jest", test_file, "--passWithNoTests"]
         else:
             # For non-test JS/TS files, run a node syntax check
-            cmd = ["node", "--check", test_file]
+            cmd = [_TOOLS["node"], "--check", test_file]
     else:
         return TestResult(test_file, False, "", f"Unsupported file extension: {ext}", [])
 
@@ -162,31 +622,64 @@ def _run_locally(repo_path: str, test_file: str) -> TestResult:
 # Shared execution + parsing
 # ---------------------------------------------------------------------------
 
-def _execute_and_parse(test_file: str, cmd: list[str], cwd: str) -> TestResult:
+def _execute_and_parse(test_file: str, cmd: list[str], cwd: str, timeout: float = TEST_TIMEOUT) -> TestResult:
     """Execute *cmd* and parse pytest output into a TestResult."""
     try:
-        # On Windows, we need shell=True to find npx.cmd, npm.cmd, python.exe, etc.
-        use_shell = (os.name == "nt")
-        
-        if use_shell and isinstance(cmd, list):
-            # On Windows, shell=True with a list can be flaky; a string is safer.
-            command_str = subprocess.list2cmdline(cmd)
-        else:
-            command_str = " ".join(cmd) if isinstance(cmd, list) else cmd
-        
-        proc = subprocess.run(
-            command_str if use_shell else cmd,
-            capture_output=True,
+        # Merge stderr into stdout and keep only the last OUTPUT_TAIL_LINES
+        # lines, so a chatty test run never holds its whole output in memory.
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
+            errors="replace",
+            # Read side only: a 64 KiB buffer lets each pipe read take whatever
+            # the test run has written, while lines are still split below
+            bufsize=65536,
             cwd=cwd,
-            timeout=300,
-            shell=use_shell,
         )
-        stdout = proc.stdout or ""
-        stderr = proc.stderr or ""
-        combined = stdout + "\n" + stderr
-        passed = proc.returncode == 0
-        failures = _parse_failures(combined, test_file)
+        timed_out = threading.Event()
+
+        def _on_timeout():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, _on_timeout)
+        timer.start()
+        tail: deque[str] = deque(maxlen=OUTPUT_TAIL_LINES)
+        # Failure lines are picked out as they stream, so a failure early in a
+        # long run is still parsed after it has scrolled out of the tail
+        failure_lines: list[str] = []
+        keep_next = 0
+        internal_error = False
+        try:
+            for line in proc.stdout:
+                tail.append(line)
+                if len(failure_lines) < FAILURE_LINES_MAX:
+                    if keep_next:
+                        # Message lines that follow a `File "...", line N` hit
+                        failure_lines.append(line)
+                        keep_next -= 1
+                    elif _is_failure_line(line):
+                        failure_lines.append(line)
+                        if _TB_PY.search(line):
+                            keep_next = 3
+                if line.startswith("INTERNALERROR"):
+                    # pytest itself crashed; the rest is just its traceback
+                    internal_error = True
+                    proc.kill()
+                    break
+            proc.wait()
+        finally:
+            timer.cancel()
+            proc.stdout.close()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+        combined = "".join(tail)
+        stdout, stderr = combined, ""
+        passed = proc.returncode == 0 and not internal_error
+        failures = _parse_failures("".join(failure_lines), test_file, context=combined)
 
         # If the command failed but no specific test failures were parsed, 
         # add a generic execution failure to ensure the agent doesn't skip it.
@@ -211,7 +704,7 @@ def _execute_and_parse(test_file: str, cmd: list[str], cwd: str) -> TestResult:
             test_file=test_file,
             passed=False,
             stdout="",
-            stderr="Test run timed out after 300 seconds.",
+            stderr=f"Test run timed out after {timeout} seconds.",
             failures=[{
                 "file": test_file,
                 "line": 0,
@@ -235,117 +728,83 @@ def _execute_and_parse(test_file: str, cmd: list[str], cwd: str) -> TestResult:
         )
 
 
-def _parse_failures(output: str, test_file: str) -> list[dict]:
+def _is_failure_line(line: str) -> bool:
+    """True for the runner output lines _parse_failures reads (tracebacks and FAILED/ERROR summaries)."""
+    if "::ERROR" in line or ("FAILED" in line and "::" in line):
+        return True
+    line = line.strip()
+    return bool(_TB_PY.search(line) or _TB_SHORT.match(line))
+
+
+def _parse_failures(output: str, test_file: str, context: str | None = None) -> list[dict]:
     """
     Heuristically parse pytest short-traceback output into structured failures.
     Each failure: { file, line, error_message, bug_type }
+    *context* (default: *output*) is the text bug types are classified against.
     """
+    if context is None:
+        context = output
     failures = []
     lines = output.splitlines()
 
     # Priority 1: Specific files mentioned in the traceback (e.g. E File "...")
-    i = 0
     found_specific_src = False
-    
-    while i < len(lines):
-        line = lines[i].strip()
-        
+
+    for i, raw_line in enumerate(lines):
+        line = raw_line.strip()
+
         # Look for "File "path/to/file.py", line 123" (Python traceback style)
         # It might have a prefix like "E     File"
-        if 'File "' in line and '.py", line ' in line:
-            try:
-                # Extract EVERYTHING between the first and last double quote on the line
-                # to handle spaces in paths
-                path_start = line.find('"') + 1
-                path_end = line.find('"', path_start)
-                raw_path = line[path_start:path_end]
-                
-                # Extract line number
-                lineno_part = line.split('", line ')[1].split()[0].rstrip(',')
-                lineno = int(lineno_part)
-                
-                # Check for error message in subsequent lines
-                error_msg = ""
-                for j in range(1, 4):
-                    if i + j < len(lines):
-                        next_line = lines[i+j].strip()
-                        # Handle "E   SyntaxError", "E FileNotFoundError" or just "SyntaxError"
-                        if any(err in next_line for err in ("SyntaxError", "IndentationError", "NameError", "TypeError", "AttributeError", "ImportError", "FileNotFoundError", "ModuleNotFoundError")):
-                            error_msg = next_line
-                            break
-                
-                if not error_msg:
-                    error_msg = "Error detected in this file (check traceback)"
-
-                # Handle Windows paths and make relative to repo
-                source_file = raw_path
-                if "cloned_repos" in raw_path.replace("\\", "/"):
-                    parts_path = raw_path.replace("\\", "/").split("/")
-                    if "cloned_repos" in parts_path:
-                        idx = parts_path.index("cloned_repos")
-                        if idx + 2 < len(parts_path):
-                            source_file = "/".join(parts_path[idx+2:])
-
-                if "site-packages" not in raw_path and ".venv" not in raw_path:
-                    bug_type = _classify_bug(error_msg + " " + output)
-                    failures.append({
-                        "file": source_file,
-                        "line": lineno,
-                        "error_message": error_msg,
-                        "bug_type": bug_type,
-                    })
-                    found_specific_src = True
-            except (IndexError, ValueError):
-                pass
+        m = _TB_PY.search(line)
+        if m:
+            raw_path, lineno = m.group(1), int(m.group(2))
+
+            # Check for error message in subsequent lines
+            # Handle "E   SyntaxError", "E FileNotFoundError" or just "SyntaxError"
+            error_msg = ""
+            for next_line in lines[i + 1:i + 4]:
+                next_line = next_line.strip()
+                if _ERROR_KEYWORDS_RE.search(next_line):
+                    error_msg = next_line
+                    break
+
+            if not error_msg:
+                error_msg = "Error detected in this file (check traceback)"
+
+            if not any(x in raw_path for x in _TB_SKIP_PATHS):
+                bug_type = _classify_bug(error_msg, context)
+                failures.append({
+                    "file": _relative_to_clone(raw_path),
+                    "line": lineno,
+                    "error_message": error_msg,
+                    "bug_type": bug_type,
+                })
+                found_specific_src = True
+            continue
 
         # Also look for the "path/to/file.py:123: Error" style
-        # Careful with Windows drive letters (C:) 
-        elif ".py:" in line and ": " in line:
+        # Careful with Windows drive letters (C:) – the path group is non-greedy up to ".py:<digits>: "
+        m = _TB_SHORT.match(line)
+        if m:
             # Skip library paths
-            if "site-packages" in line or ".venv" in line or "AppData" in line:
-                i += 1
+            if any(x in line for x in _SHORT_SKIP_PATHS):
                 continue
-                
-            # Split by ": " to find the error message first
-            parts_msg = line.split(": ", 1)
-            if len(parts_msg) == 2:
-                file_line_part = parts_msg[0].strip().lstrip("E").strip()
-                error_msg = parts_msg[1].strip()
-                
-                # Split file_line_part by ":" from the right to get line number
-                parts_path = file_line_part.rsplit(":", 1)
-                if len(parts_path) == 2:
-                    raw_path = parts_path[0]
-                    try:
-                        lineno = int(parts_path[1])
-                    except ValueError:
-                        lineno = 0
-                    
-                    source_file = raw_path
-                    if "cloned_repos" in raw_path.replace("\\", "/"):
-                        pp = raw_path.replace("\\", "/").split("/")
-                        if "cloned_repos" in pp:
-                            idx = pp.index("cloned_repos")
-                            if idx + 2 < len(pp):
-                                source_file = "/".join(pp[idx+2:])
-
-                    bug_type = _classify_bug(error_msg + " " + output)
-                    failures.append({
-                        "file": source_file,
-                        "line": lineno,
-                        "error_message": error_msg,
-                        "bug_type": bug_type,
-                    })
-                    found_specific_src = True
-
-        i += 1
+            raw_path, lineno, error_msg = m.group(1), int(m.group(2)), m.group(3).strip()
+            bug_type = _classify_bug(error_msg, context)
+            failures.append({
+                "file": _relative_to_clone(raw_path),
+                "line": lineno,
+                "error_message": error_msg,
+                "bug_type": bug_type,
+            })
+            found_specific_src = True
 
     # Priority 2: Fallback to the test file itself ONLY if no specific source file was found
     if not found_specific_src:
         for line in lines:
             if "::ERROR" in line or ("FAILED" in line and "::" in line):
                 error_msg = line.strip()
-                bug_type = _classify_bug(error_msg, output)
+                bug_type = _classify_bug(error_msg, context)
                 failures.append({
                     "file": test_file,
                     "line": 0,
@@ -366,20 +825,26 @@ def _parse_failures(output: str, test_file: str) -> list[dict]:
     return unique
 
 
+def _relative_to_clone(raw_path: str) -> str:
+    """Handle Windows paths and make paths under cloned_repos/<run dir>/ relative to the repo."""
+    norm = raw_path.replace("\\", "/")
+    if "cloned_repos" in norm:
+        parts_path = norm.split("/")
+        if "cloned_repos" in parts_path:
+            idx = parts_path.index("cloned_repos")
+            if idx + 2 < len(parts_path):
+                return "/".join(parts_path[idx+2:])
+    return raw_path
+
+
 def _classify_bug(text: str, full_output: str = "") -> str:
     """
     Classify a bug into one of the six categories based on keywords.
     Categories: LINTING | SYNTAX | LOGIC | TYPE_ERROR | IMPORT | INDENTATION
+    Categories are tried in priority order; each is one case-insensitive regex
+    search over *text* and then *full_output* (no lowercased copy, no concatenation).
     """
-    t = (text + " " + full_output).lower()
-    if "indentationerror" in t or "unexpected indent" in t or "indentation" in t:
-        return "INDENTATION"
-    if "syntaxerror" in t or "invalid syntax" in t or "syntax" in t or "colon" in t or "missing" in t:
-        return "SYNTAX"
-    if "importerror" in t or "modulenotfounderror" in t or "cannot import" in t:
-        return "IMPORT"
-    if "typeerror" in t or "type error" in t or "unsupported operand" in t:
-        return "TYPE_ERROR"
-    if "flake8" in t or "pylint" in t or "pep8" in t or "lint" in t or "unused" in t or "import" in t:
-        return "LINTING"
+    for bug_type, pattern in _BUG_PATTERNS:
+        if pattern.search(text) or (full_output and pattern.search(full_output)):
+            return bug_type
     return "LOGIC"
@@ -5,18 +5,53 @@ git_utils.py – GitPython helpers for clone, branch, commit, push
 import os
 import logging
 import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterator
 from urllib.parse import urlparse, urlunparse
 
-from git import Repo, GitCommandError
+from git import Repo, GitCommandError, GitError
 from dotenv import load_dotenv
 
+from docker_runner import release_sandbox
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+SHALLOW_CLONE_OPTIONS = ["--depth=1", "--single-branch", "--no-tags"]
+# Parallel checkout (git >= 2.32, ignored by older git): one worker per core. Passed as
+# environment config (git >= 2.31) because GitPython rejects --config/-c as unsafe options.
+CLONE_CONFIG_ENV = {
+    "GIT_CONFIG_COUNT": "1",
+    "GIT_CONFIG_KEY_0": "checkout.workers",
+    "GIT_CONFIG_VALUE_0": "0",
+}
+
 # Standardize the clones directory to an absolute path in the project root
 CLONES_DIR = Path("c:/Users/shese/Desktop/CICD_AA/cloned_repos")
 
+# File contents read by get_all_files: abs path -> (mtime_ns, size, text or None if binary)
+CONTENT_CACHE_SIZE = 8192
+CONTENT_CACHE_BYTES = 64 * 1024 * 1024   # total file size the cache may hold
+_content_cache: OrderedDict[str, tuple[int, int, str | None]] = OrderedDict()
+_content_cache_bytes = 0
+_content_cache_lock = threading.Lock()
+
+# get_all_files walk settings
+_SKIP_DIRS = frozenset({".git", "node_modules", "__pycache__", ".venv", "venv", ".tox"})
+_HIDDEN_FILES_ALLOWED = frozenset({".env", ".gitignore"})
+# Same pruning for `git ls-files`, so git never lists files under those dirs
+_SKIP_PATHSPECS = tuple(f":(exclude,glob)**/{d}/**" for d in sorted(_SKIP_DIRS) if not d.startswith(".")) + (
+    ":(exclude,glob)**/.*/**",
+)
+# Allowed hidden files anywhere in the tree, for the ignored-files query in _list_git_files
+_HIDDEN_PATHSPECS = tuple(f":(glob)**/{name}" for name in sorted(_HIDDEN_FILES_ALLOWED))
+MAX_FILE_BYTES = 2 * 1024 * 1024   # larger files are left out of the viewer
+READ_WORKERS = 16
+
 
 # ---------------------------------------------------------------------------
 # Public helpers
@@ -43,7 +78,7 @@ def clone_repo(repo_url: str, run_id: str, pat: str | None = None, team_name: st
 
     # Clean up any leftover clone from a previous (crashed) run
     if clone_path.exists():
-        shutil.rmtree(clone_path, ignore_errors=True)
+        _discard_dir(clone_path)
 
     CLONES_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -52,8 +87,16 @@ def clone_repo(repo_url: str, run_id: str, pat: str | None = None, team_name: st
 
     logger.info(f"Cloning {repo_url} → {clone_path}")
     # Set non-interactive environment for clone
-    env = {"GIT_TERMINAL_PROMPT": "0", "GIT_ASKPASS": "echo"}
-    repo = Repo.clone_from(auth_url, str(clone_path), depth=50, env=env)
+    env = {"GIT_TERMINAL_PROMPT": "0", "GIT_ASKPASS": "echo", **CLONE_CONFIG_ENV}
+    # The pipeline only needs HEAD: one commit, one branch, no tags
+    try:
+        repo = Repo.clone_from(auth_url, str(clone_path), multi_options=SHALLOW_CLONE_OPTIONS, env=env)
+    except GitError as exc:
+        # e.g. dumb-HTTP servers without shallow support, or an option GitPython refuses
+        # Not str(exc): the command line carries the PAT-bearing URL
+        logger.warning(f"Shallow clone failed, retrying with full history ({type(exc).__name__}, exit {getattr(exc, 'status', 'n/a')})")
+        shutil.rmtree(clone_path, ignore_errors=True)
+        repo = Repo.clone_from(auth_url, str(clone_path), env=env)
     
     # Configure local repo to NEVER use credential manager
     with repo.config_writer() as cw:
@@ -175,60 +218,184 @@ def commit_and_push(
 
 def get_all_files(repo: Repo, extensions: tuple = None) -> list[dict]:
     """
-    Walk the repo working tree and return a list of
+    List the repo's files and return a list of
     { path: str, content: str } dicts for the frontend Monaco viewer.
-    Skips .git, node_modules, __pycache__, binary files, and hidden dirs.
-    """
-    results = []
-    root = Path(repo.working_dir)
-    skip_dirs = {".git", "node_modules", "__pycache__", ".venv", "venv", ".tox"}
-
-    for file_path in root.rglob("*"):
-        if file_path.is_file():
-            # Skip unwanted directories
-            if any(part in skip_dirs or part.startswith(".") for part in file_path.parts):
-                if not (file_path.name == ".env" or file_path.name == ".gitignore"): # Allow specific useful hidden files
-                    continue
-            
-            # Extension filter (optional, if none provided we show everything text-based)
-            if extensions and file_path.suffix not in extensions:
-                continue
-
-            rel = str(file_path.relative_to(root)).replace("\\", "/")
-            try:
-                # Optimized for speed: check if file is likely binary before reading
-                with open(file_path, "rb") as f:
-                    chunk = f.read(1024)
-                    if b'\0' in chunk: # Simplistic binary check
-                        continue
-                
-                content = file_path.read_text(encoding="utf-8", errors="replace")
-                results.append({
-                    "path": rel, 
-                    "content": content,
-                    "original_content": content # Preserve original for diff
-                })
-            except Exception as exc:
-                logger.warning(f"Could not read {rel}: {exc}")
-    return results
+    Git repos are listed from the index (tracked + untracked, minus ignored);
+    plain folders are walked. Skips .git, node_modules, __pycache__, binary
+    files, and hidden dirs.
+    """
+    root = repo.working_dir
+    paths = _list_git_files(repo)
+    if paths is None:
+        paths = _walk_files(root, "")
+    rel_paths = [
+        rel for rel in paths
+        # Extension filter (optional, if none provided we show everything text-based)
+        if not extensions or os.path.splitext(rel)[1] in extensions
+    ]
+    if not rel_paths:
+        return []
+
+    def _read_one(rel: str) -> dict | None:
+        full = os.path.join(root, rel)
+        try:
+            st = os.stat(full)
+            if st.st_size > MAX_FILE_BYTES:
+                return None
+            content = _read_text_cached(full, st)
+            if content is None: # Binary file
+                return None
+            # original_content is only attached once a fix changes the file
+            return {"path": rel, "content": content}
+        except FileNotFoundError:
+            return None   # deleted in the working tree but still in the index
+        except Exception as exc:
+            logger.warning(f"Could not read {rel}: {exc}")
+            return None
+
+    # Reads are I/O bound; ex.map keeps listing order
+    with ThreadPoolExecutor(max_workers=min(READ_WORKERS, len(rel_paths))) as ex:
+        return [r for r in ex.map(_read_one, rel_paths) if r is not None]
 
 
 def cleanup_clone(repo: Repo) -> None:
     """Remove the cloned directory after the run."""
     try:
-        shutil.rmtree(repo.working_dir, ignore_errors=True)
+        release_sandbox(repo.working_dir)
+        forget_cached_files(repo.working_dir)
+        _discard_dir(Path(repo.working_dir))
         logger.info(f"Cleaned up {repo.working_dir}")
     except Exception as exc:
         logger.warning(f"Cleanup failed: {exc}")
 
 
+def forget_cached_files(root: str | Path) -> None:
+    """Drop every cached file content under *root* (e.g. when its clone is deleted)."""
+    global _content_cache_bytes
+    prefixes = tuple({str(Path(root)) + os.sep, str(Path(root).resolve()) + os.sep})
+    with _content_cache_lock:
+        for key in [k for k in _content_cache if k.startswith(prefixes)]:
+            _content_cache_bytes -= _content_cache.pop(key)[1]
+
+
+def sweep_trash(directory: Path = CLONES_DIR) -> None:
+    """
+    Delete `.trash-*` dirs left in *directory* by _discard_dir threads that died with
+    the process, on a daemon thread.
+    """
+    try:
+        leftovers = [p for p in directory.glob(".trash-*") if p.is_dir()]
+    except OSError:
+        return
+    for trash in leftovers:
+        threading.Thread(
+            target=shutil.rmtree, args=(trash,), kwargs={"ignore_errors": True},
+            name="sweep-trash", daemon=True,
+        ).start()
+
+
 # ---------------------------------------------------------------------------
 # Private helpers
 # ---------------------------------------------------------------------------
 
+def _discard_dir(path: Path) -> None:
+    """
+    Move *path* out of the way with an atomic rename and delete it on a daemon thread,
+    so callers don't wait on rmtree. Falls back to a blocking rmtree if the rename fails
+    (e.g. a file inside is locked on Windows).
+    """
+    trash = path.parent / f".trash-{uuid.uuid4().hex}"
+    try:
+        path.rename(trash)
+    except OSError:
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    threading.Thread(
+        target=shutil.rmtree, args=(trash,), kwargs={"ignore_errors": True},
+        name="discard-clone", daemon=True,
+    ).start()
+
+
 def _inject_pat(url: str, pat: str) -> str:
     """Inject GitHub PAT into an HTTPS URL: https://PAT@github.com/..."""
     parsed = urlparse(url)
     authed = parsed._replace(netloc=f"{pat}@{parsed.hostname}")
     return urlunparse(authed)
 
+
+def _list_git_files(repo: Repo) -> list[str] | None:
+    """Return repo-relative paths from `git ls-files`, or None if *repo* is not a git repo."""
+    if not hasattr(repo, "git"):
+        return None
+    try:
+        out = repo.git.ls_files("-z", "--cached", "--others", "--exclude-standard", "--", ".", *_SKIP_PATHSPECS)
+        # .env and friends are usually gitignored, which --exclude-standard hides; the walk
+        # fallback lists them, so add the ignored ones back
+        ignored = repo.git.ls_files("-z", "--others", "--ignored", "--exclude-standard", "--", *_HIDDEN_PATHSPECS, *_SKIP_PATHSPECS)
+    except GitCommandError as exc:
+        logger.warning(f"git ls-files failed, walking the tree instead: {exc}")
+        return None
+    # Skipped and hidden dirs are already pruned by the pathspecs; only hidden files remain to filter.
+    # --cached lists each stage of a conflicted file; keep the first
+    paths = out.split("\0") + ignored.split("\0")
+    return [rel for rel in dict.fromkeys(paths) if rel and _is_listed(rel)]
+
+
+def _is_listed(rel: str) -> bool:
+    """Apply _walk_files' hidden-file rule to a repo-relative path."""
+    name = rel.rpartition("/")[2]
+    return not name.startswith(".") or name in _HIDDEN_FILES_ALLOWED
+
+
+def _walk_files(directory: str, prefix: str) -> Iterator[str]:
+    """Yield repo-relative file paths under *directory*, pruning skipped and hidden dirs before descending."""
+    try:
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError as exc:
+        logger.warning(f"Could not list {directory}: {exc}")
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name in _SKIP_DIRS or entry.name.startswith("."):
+                continue
+            yield from _walk_files(entry.path, f"{prefix}{entry.name}/")
+        elif entry.is_file(follow_symlinks=False):
+            # Allow specific useful hidden files
+            if entry.name.startswith(".") and entry.name not in _HIDDEN_FILES_ALLOWED:
+                continue
+            yield prefix + entry.name
+
+
+def _read_text_cached(file_path: str, st: os.stat_result) -> str | None:
+    """
+    Return the decoded text of *file_path*, or None if it looks binary.
+    Results are kept in an LRU keyed on (mtime_ns, size), so refreshing the file
+    list re-reads only files that changed and hands back the same str object otherwise.
+    """
+    key = file_path
+    with _content_cache_lock:
+        cached = _content_cache.get(key)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            _content_cache.move_to_end(key)
+            return cached[2]
+
+    # One open: sniff the first KiB, and only read the rest if it looks like text
+    with open(file_path, "rb") as f:
+        head = f.read(1024)
+        if b'\0' in head: # Simplistic binary check
+            content = None
+        else:
+            content = (head + f.read()).decode("utf-8", errors="replace")
+
+    global _content_cache_bytes
+    with _content_cache_lock:
+        old = _content_cache.pop(key, None)
+        if old is not None:
+            _content_cache_bytes -= old[1]
+        _content_cache[key] = (st.st_mtime_ns, st.st_size, content)
+        _content_cache_bytes += st.st_size
+        while len(_content_cache) > CONTENT_CACHE_SIZE or _content_cache_bytes > CONTENT_CACHE_BYTES:
+            _, evicted = _content_cache.popitem(last=False)
+            _content_cache_bytes -= evicted[1]
+    return content
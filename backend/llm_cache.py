@@ -0,0 +1,91 @@
+"""
+llm_cache.py – Persistent exact-match cache for LLM responses (SQLite)
+
+Sits behind llm_client's in-memory LRUs so identical prompts survive a backend
+restart (re-runs of the same repo, CI re-triggers) without another API call.
+
+Usage:
+    key = cache_key("fix", bug_type, file_path, code_hash, model)
+    hit = get(key)
+    if hit is None:
+        put(key, answer)
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from state import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB = DATA_DIR / "llm_cache.db"
+MAX_ROWS = 5000   # oldest responses past this are dropped on put
+
+_conn: sqlite3.Connection | None = None
+_lock = threading.Lock()
+
+
+# ── Public API ────────────────────────────────────────────────────────────
+
+def cache_key(*parts) -> str:
+    """Hash *parts* into a cache key (blake2b, unit-separator joined)."""
+    joined = "\x1f".join(str(p) for p in parts)
+    return hashlib.blake2b(joined.encode("utf-8", "replace"), digest_size=32).hexdigest()
+
+
+def get(key: str) -> str | None:
+    """Return the cached response for *key*, or None (also on any DB error)."""
+    try:
+        with _lock:
+            row = _connect().execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as exc:
+        logger.warning(f"[LLM cache] read failed: {exc}")
+        return None
+
+
+def put(key: str, value: str) -> None:
+    """Store *value* under *key*, keeping at most MAX_ROWS responses; failures are logged and ignored."""
+    try:
+        with _lock:
+            conn = _connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (MAX_ROWS,),
+            )
+            conn.commit()
+    except sqlite3.Error as exc:
+        logger.warning(f"[LLM cache] write failed: {exc}")
+
+
+def clear() -> None:
+    """Drop every cached response."""
+    with _lock:
+        conn = _connect()
+        conn.execute("DELETE FROM responses")
+        conn.commit()
+
+
+# ── Private helper ────────────────────────────────────────────────────────
+
+def _connect() -> sqlite3.Connection:
+    """Open the cache DB once per process (callers hold _lock)."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+        _conn.commit()
+    return _conn
@@ -15,10 +15,26 @@ Usage:
 """
 
 import os
+import io
+import ast
+import re
+import string
+import asyncio
+import hashlib
+import json
 import logging
+import threading
+import time
+import weakref
+from dataclasses import dataclass, replace
+import httpx
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlparse
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI, RateLimitError
 from state import GLOBAL_CONFIG
+import llm_cache
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -29,13 +45,127 @@ NVIDIA_API_KEY    = GLOBAL_CONFIG.get("nvidia_api_key") or os.getenv("NVIDIA_API
 NVIDIA_BASE_URL   = os.getenv("NVIDIA_BASE_URL",  "https://integrate.api.nvidia.com/v1")
 NVIDIA_MODEL      = os.getenv("NVIDIA_MODEL",     "mistralai/mixtral-8x22b-instruct-v0.1")
 
+
+@dataclass(slots=True, frozen=True)
+class NvidiaConfig:
+    """Primary endpoint settings; per-request overrides are applied with dataclasses.replace."""
+    api_key: str
+    base_url: str
+    model: str
+
+
+_DEFAULT_CFG = NvidiaConfig(NVIDIA_API_KEY, NVIDIA_BASE_URL, NVIDIA_MODEL)
+_CFG_FIELDS = frozenset(("api_key", "base_url", "model"))
+
 # ── Ollama (local fallback) ───────────────────────────────────────────────
 OLLAMA_BASE_URL   = os.getenv("OLLAMA_BASE_URL",  "http://localhost:11434")
 OLLAMA_MODEL      = os.getenv("OLLAMA_MODEL",     "llama3")
+OLLAMA_TIMEOUT    = 30
+
+# Sampling temperature for every completion; 0 makes answers cacheable
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.5"))
+
+# Whole-answer timeout for non-streamed completions (max_tokens=2048 can take a while)
+COMPLETION_TIMEOUT = 180
+
+# ── Output token caps ─────────────────────────────────────────────────────
+# max_tokens is sized from the input instead of a flat 2048: short fixes reserve
+# less on the provider, large files are no longer cut off at 2048 tokens.
+DEFAULT_MAX_TOKENS = 2048
+FIX_MAX_TOKENS     = (256, 4096)   # (floor, ceiling) for a single-file fix
+BATCH_MAX_TOKENS   = 8192          # ceiling for a tuple-batched fix answer
+TESTS_MAX_TOKENS   = (2048, 4096)  # (floor, ceiling) for a generated test suite
+COMMIT_MAX_TOKENS  = 40            # one-line commit message (<= 72 chars)
+
+# ── Client pool ───────────────────────────────────────────────────────────
+# One OpenAI client (and httpx connection pool) per endpoint + key, reused across
+# calls so TCP/TLS connections stay open instead of being rebuilt per request.
+_CLIENT_POOL: dict[tuple[str, str], OpenAI] = {}
+_ASYNC_CLIENT_POOL = weakref.WeakKeyDictionary()   # event loop -> {(base_url, api_key): AsyncOpenAI}
+_client_lock = threading.Lock()
+# Keep-alive HTTP client for the Ollama fallback (httpx ships with openai)
+_OLLAMA_HTTP = httpx.Client(
+    base_url=OLLAMA_BASE_URL,
+    timeout=OLLAMA_TIMEOUT,
+    limits=httpx.Limits(max_keepalive_connections=8),
+)
+
+# ── Rate limiting ─────────────────────────────────────────────────────────
+# Client-side token bucket per API key, so a burst of parallel fixes queues locally
+# instead of tripping the provider's 429s. A 429 is retried once after Retry-After
+# if that is short; otherwise the caller falls through to Ollama.
+RATE_LIMIT_CAPACITY = 10        # burst size (requests)
+RATE_LIMIT_REFILL   = 2.0       # tokens per second
+RATE_LIMIT_MAX_WAIT = 10.0      # longest Retry-After we are willing to sleep for
+_buckets: dict[str, list[float]] = {}   # api_key -> [tokens, last_refill]
+_bucket_lock = threading.Lock()
+
+# ── Response cache ────────────────────────────────────────────────────────
+# Exact-match, process-local LRU in front of the persistent llm_cache DB. The heal
+# loop re-asks the same failure on every retry; identical inputs get the previously
+# generated answer without an API call, also after a backend restart.
+# Only on by default for greedy decoding: a sampled answer pinned in the cache
+# would replay the same (possibly bad) fix on every retry. LLM_RESPONSE_CACHE=1/0 overrides.
+RESPONSE_CACHE_ENABLED = os.getenv("LLM_RESPONSE_CACHE", "1" if LLM_TEMPERATURE == 0 else "0") == "1"
+if not RESPONSE_CACHE_ENABLED:
+    # Logged once at import; warning so it shows before logging is configured
+    logger.warning(
+        "[LLM] Response cache disabled (LLM_TEMPERATURE=%s); set LLM_TEMPERATURE=0 or LLM_RESPONSE_CACHE=1 to enable it",
+        LLM_TEMPERATURE,
+    )
+RESPONSE_CACHE_SIZE = 256
+_fix_cache: OrderedDict[str, str] = OrderedDict()
+_commit_msg_cache: OrderedDict[str, str] = OrderedDict()
+_tests_cache: OrderedDict[str, str] = OrderedDict()
+_cache_lock = threading.Lock()
+# Single-flight: cache key -> Future of the fix currently being generated for it, so
+# identical concurrent requests share one LLM call
+_inflight: dict[str, Future] = {}
+
+# Max approx. tokens of code + errors packed into one tuple-batched fix prompt
+BATCH_FIX_TOKEN_BUDGET = 6000
+
+# ── Large inputs ──────────────────────────────────────────────────────────
+MAX_FIX_INPUT_CHARS   = 200_000   # refused: the provider would only burn the completion timeout
+FOCUS_FIX_INPUT_CHARS = 50_000    # above this, Python fixes send only the enclosing def/class
+
+# ── Local fixes (no LLM call) ─────────────────────────────────────────────
+_UNUSED_IMPORT_RE = re.compile(r"unused import '([\w.]+)'|'([\w.]+)' imported but unused", re.IGNORECASE)
+
+# ── Project context compaction ────────────────────────────────────────────
+# project_context is resent with every fix of a run; blank and comment-only lines
+# cost input tokens without helping the model. Compacted once per distinct context.
+PROJECT_CONTEXT_MAX_TOKENS = 8000   # approx. (len // 4), matches agents.CONTEXT_TOKEN_BUDGET
+_compact_context_cache: OrderedDict[str, str] = OrderedDict()
+_NOISE_LINE_RE = re.compile(r"^[ \t]*(?:(?:#|//)(?!!).*)?\n", re.MULTILINE)
+
+# ── Response cleanup (_strip_markdown) ────────────────────────────────────
+_FENCE_RE = re.compile(
+    r"```(?:[ \t]*(?:python|javascript|js|ts|typescript|jsx|tsx|html|css)[ \t]*(?=\n|$))?(.*?)(?:```|$)",
+    re.DOTALL | re.IGNORECASE,
+)
+# Context markers / chatter the model sometimes echoes, plus stray fences
+_LEAKED_LINE_RE = re.compile(
+    r"^[ \t]*(?:--- File:|\[\[\[ CONTEXT_FILE:|Full Project Source Code Context:|Here is the fixed code|```).*(?:\n|$)",
+    re.MULTILINE,
+)
 
 # ── Prompt template ───────────────────────────────────────────────────────
+# Stable instructions come first and per-request fields last, so repeated calls
+# share a long identical prefix the provider can serve from its prompt/KV cache.
 FIX_PROMPT = """\
-You are an expert software engineer. Fix the following {bug_type} bug in the file '{file_path}' at line {line_number}.
+You are an expert software engineer. You will be given a bug report for one file of a project, the file's original code, and other project files for reference.
+
+Instructions:
+1. Return ONLY the corrected FULL content of the target file.
+2. DO NOT include any explanations, walkthroughs, or markdown code fences (```).
+3. DO NOT include any of the reference files provided in the "Project Structure Context" section.
+4. IMPORTANT: Add concise, helpful comments inside the code explaining exactly what you changed and why (e.g. # FIXED: Corrected edge case handling).
+5. If the error is actually in a different file, fix that file instead and return ONLY its content.
+6. Return the raw code as plain text.
+
+## Task
+Fix the following {bug_type} bug in the file '{file_path}' at line {line_number}.
 
 Project Structure Context (other files for reference):
 {project_context}
@@ -47,14 +177,29 @@ Original code of '{file_path}':
 ```
 {original_code}
 ```
+""".strip()
+
+# Tuple batching: several small fixes share one copy of the instructions.
+BATCH_FIX_PROMPT = """\
+You are an expert software engineer. You will be given several numbered items; each is one bug report for one file together with that file's original code.
 
 Instructions:
-1. Return ONLY the corrected FULL content of the file '{file_path}'.
-2. DO NOT include any explanations, walkthroughs, or markdown code fences (```).
-3. DO NOT include any of the reference files provided in the "Project Structure Context" section.
-4. IMPORTANT: Add concise, helpful comments inside the code explaining exactly what you changed and why (e.g. # FIXED: Corrected edge case handling).
-5. If the error is actually in a different file, fix that file instead and return ONLY its content.
-6. Return the raw code as plain text.
+1. Fix every item independently. For each item produce the corrected FULL content of its file.
+2. Add concise, helpful comments inside the code explaining exactly what you changed and why (e.g. # FIXED: Removed unused import).
+3. Return ONLY a JSON array of strings, with no explanations and no markdown code fences: element j is the corrected file for item j, in item order, and the array has exactly as many elements as there are items.
+
+## Items
+{items}
+""".strip()
+
+BATCH_FIX_ITEM = """\
+[{index}] {bug_type} bug in '{file_path}' at line {line_number}
+Error/Instruction:
+{error_message}
+Original code:
+```
+{original_code}
+```
 """.strip()
 
 COMMIT_PROMPT = """\
@@ -63,17 +208,9 @@ Start with a verb (Fix, Remove, Add, Update). No code fences, no quotes.
 """.strip()
 
 GENERATE_TESTS_PROMPT = """\
-You are an expert software engineer. Generate a STUNNINGLY comprehensive and deep test suite for the following {language} code.
+You are an expert software engineer. Generate a STUNNINGLY comprehensive and deep test suite for the source code given at the end.
 Goal: At least 15-20 distinct test cases (assertions) for this specific file, contributing to a total project goal of 50+ test cases.
 
-Project Structure Context:
-{project_context}
-
-Source Code to Test:
-```
-{source_code}
-```
-
 Instructions:
 1. **High Volume & Depth**: Generate a large number of tests. Do not stop at just 2 or 3. Aim for 10-15+ scenarios per file.
 2. **Categories**:
@@ -84,10 +221,41 @@ Instructions:
    - **Error Handling**: Verify robust failure modes and correct error propagation.
 3. **Framework Best Practices**: Use framework-idiomatic patterns (e.g., React Testing Library hooks, Vitest/Jest for JS/TS, pytest for Python).
 4. **Mocks & Stubs**: Mock external dependencies (APIs, DBs, File System) to Keep tests fast and isolated.
-5. **Output**: Return ONLY the code for the test suite. No explanations, no markdown code fences. The output must be valid, runnable {language} code.
+5. **Output**: Return ONLY the code for the test suite. No explanations, no markdown code fences. The output must be valid, runnable code in the language named below.
+
+## Task
+Language: {language}
+
+Project Structure Context:
+{project_context}
+
+Source Code to Test:
+```
+{source_code}
+```
 """.strip()
 
 
+# Templates split into (literal, field) pairs once at import, so rendering a prompt
+# is a single join instead of re-parsing the format string on every call.
+def _compile_template(template: str) -> tuple[tuple[str, str | None], ...]:
+    return tuple((literal, field) for literal, field, _spec, _conv in string.Formatter().parse(template))
+
+
+def _render(compiled: tuple[tuple[str, str | None], ...], **fields) -> str:
+    return "".join(
+        literal if field is None else literal + str(fields[field])
+        for literal, field in compiled
+    )
+
+
+_FIX_TMPL = _compile_template(FIX_PROMPT)
+_BATCH_FIX_TMPL = _compile_template(BATCH_FIX_PROMPT)
+_BATCH_ITEM_TMPL = _compile_template(BATCH_FIX_ITEM)
+_COMMIT_TMPL = _compile_template(COMMIT_PROMPT)
+_TESTS_TMPL = _compile_template(GENERATE_TESTS_PROMPT)
+
+
 # ── Public API ────────────────────────────────────────────────────────────
 
 def generate_fix(
@@ -102,47 +270,142 @@ def generate_fix(
     """
     Generate a fixed version of *original_code*.
     Tries NVIDIA API first; falls back to local Ollama.
+    Results that actually change the code are cached on the failure + code hash.
+    Raises ValueError for files over MAX_FIX_INPUT_CHARS.
     """
-    prompt = FIX_PROMPT.format(
-        bug_type=bug_type,
-        file_path=file_path,
-        line_number=line_number,
-        error_message=error_message,
-        original_code=original_code,
-        project_context=project_context,
-    )
+    _check_fix_input(file_path, original_code)
+    local = _local_fix(bug_type, error_message, original_code)
+    if local is not None:
+        logger.info("[LLM] Fixed %s:%s locally, no LLM call", file_path, line_number)
+        return local
+
+    cache_key = _fix_cache_key(bug_type, file_path, line_number, error_message, original_code, project_context, api_data)
+    cached = _cache_get(_fix_cache, cache_key)
+    if cached is not None:
+        logger.info("[LLM] Cache hit for %s:%s", file_path, line_number)
+        return cached
+
+    future, leader = _join_inflight(cache_key)
+    if not leader:
+        logger.info("[LLM] Waiting on in-flight fix for %s:%s", file_path, line_number)
+        return future.result()
+    try:
+        code, line, span = _focus(file_path, line_number, original_code)
+        fixed = _unfocus(
+            original_code, span,
+            _generate_fix_uncached(bug_type, file_path, line, error_message, code, project_context, api_data),
+        )
+        # Don't pin "no change" answers: a retry may still produce a real fix
+        if fixed and fixed != original_code:
+            _cache_put(_fix_cache, cache_key, fixed)
+        future.set_result(fixed)
+        return fixed
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        _leave_inflight(cache_key)
+
+
+def _generate_fix_uncached(
+    bug_type: str,
+    file_path: str,
+    line_number: int,
+    error_message: str,
+    original_code: str,
+    project_context: str,
+    api_data: dict | None,
+) -> str:
+    """Call the LLM for a fix (no caching); see generate_fix."""
+    prompt = _fix_prompt(bug_type, file_path, line_number, error_message, original_code, project_context)
     messages = [{"role": "user", "content": prompt}]
 
     # --- Primary: NVIDIA API (with optional user overrides) ---
     try:
-        logger.info(f"[LLM] Requesting fix for {file_path}:{line_number}...")
-        result = _call_nvidia(messages, api_data=api_data)
-        logger.info(f"[LLM] Fix generated for {file_path}:{line_number}")
-        return _strip_markdown(result)
+        logger.info("[LLM] Requesting fix for %s:%s...", file_path, line_number)
+        fixed = _strip_markdown(_call_nvidia(messages, api_data=api_data, max_tokens=_fix_max_tokens(original_code)))
+        # A blank answer is a failed call, not "empty the file" (only _local_fix may return "")
+        if fixed.strip():
+            logger.info("[LLM] Fix generated for %s:%s", file_path, line_number)
+            return fixed
+        logger.warning("[LLM] Primary API returned an empty fix. Trying Ollama…")
     except Exception as nvidia_err:
-        logger.warning(f"[LLM] Primary API failed: {nvidia_err}. Trying Ollama…")
+        logger.warning("[LLM] Primary API failed: %s. Trying Ollama…", nvidia_err)
 
     # --- Fallback: local Ollama ---
-    try:
-        import requests as _req
-        payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": False}
-        resp = _req.post(f"{OLLAMA_BASE_URL}/api/generate", json=payload, timeout=30)
-        resp.raise_for_status()
-        result = resp.json().get("response", "").strip()
-        logger.info(f"[LLM] Ollama fix generated for {file_path}:{line_number}")
-        return _strip_markdown(result)
-    except Exception as ollama_err:
-        logger.error(f"[LLM] Ollama also failed: {ollama_err}. Returning original code.")
+    return _ollama_fix(prompt, file_path, line_number, original_code)
 
-    return original_code
+
+def generate_fixes_tuple_batched(
+    jobs: list[dict],
+    batch_size: int = 8,
+    max_batch_tokens: int = BATCH_FIX_TOKEN_BUDGET,
+    api_data: dict | None = None,
+) -> list[str]:
+    """
+    Fix many small, independent files with few LLM calls: up to *batch_size* jobs
+    (generate_fix keyword dicts; project_context is only used by the fallback) share one prompt and come back
+    as a JSON array. Cached jobs skip the call; a batch whose answer can't be parsed
+    falls back to one generate_fix per job. Returns the fixed code in job order.
+    """
+    results: list[str | None] = [None] * len(jobs)
+    keys = []
+    pending = []
+    for i, job in enumerate(jobs):
+        results[i] = _local_fix(job["bug_type"], job["error_message"], job["original_code"])
+        key = _fix_cache_key(
+            job["bug_type"], job["file_path"], job["line_number"], job["error_message"],
+            job["original_code"], job.get("project_context", ""), api_data,
+        )
+        keys.append(key)
+        if results[i] is not None:
+            continue
+        cached = _cache_get(_fix_cache, key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+
+    # Pack pending jobs into batches that stay under the token budget
+    batches: list[list[int]] = []
+    batch, batch_tokens = [], 0
+    for i in pending:
+        cost = len(jobs[i]["original_code"]) // 4 + len(jobs[i]["error_message"]) // 4 + 50
+        if batch and (len(batch) >= batch_size or batch_tokens + cost > max_batch_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += cost
+    if batch:
+        batches.append(batch)
+
+    for batch in batches:
+        fixed = _call_fix_batch([jobs[i] for i in batch], api_data) if len(batch) > 1 else None
+        if fixed is None:
+            fixed = [generate_fix(**{**jobs[i], "api_data": api_data}) for i in batch]
+        else:
+            for i, code in zip(batch, fixed):
+                # Don't pin "no change" answers: a retry may still produce a real fix
+                if code and code != jobs[i]["original_code"]:
+                    _cache_put(_fix_cache, keys[i], code)
+        for i, code in zip(batch, fixed):
+            results[i] = code
+    return results
 
 
 def explain_error(bug_type: str, error_message: str, api_data: dict | None = None) -> str:
     """Return a short git commit message describing the fix."""
-    prompt = COMMIT_PROMPT.format(bug_type=bug_type, error_message=error_message)
+    cache_key = _cache_key("commit", bug_type, error_message, _endpoint_tag(api_data))
+    cached = _cache_get(_commit_msg_cache, cache_key)
+    if cached is not None:
+        return cached
+
+    prompt = _render(_COMMIT_TMPL, bug_type=bug_type, error_message=error_message)
     messages = [{"role": "user", "content": prompt}]
     try:
-        return _call_nvidia(messages, api_data=api_data).strip().splitlines()[0]
+        msg = _call_nvidia(messages, api_data=api_data, max_tokens=COMMIT_MAX_TOKENS).strip().splitlines()[0]
+        _cache_put(_commit_msg_cache, cache_key, msg)
+        return msg
     except Exception:
         pass
     return f"Fix {bug_type} error: {error_message[:60]}"
@@ -150,65 +413,457 @@ def explain_error(bug_type: str, error_message: str, api_data: dict | None = Non
 
 def generate_tests_for_code(source_code: str, language: str = "Python", project_context: str = "", api_data: dict | None = None) -> str:
     """Generate a test file for the given source code and language."""
-    prompt = GENERATE_TESTS_PROMPT.format(source_code=source_code, language=language, project_context=project_context)
+    cache_key = _cache_key(
+        "tests", language, _digest(source_code), _digest(project_context),
+        _endpoint_tag(api_data),
+    )
+    cached = _cache_get(_tests_cache, cache_key)
+    if cached is not None:
+        logger.info("[LLM] Cache hit for %s test suite", language)
+        return cached
+
+    prompt = _render(_TESTS_TMPL, source_code=source_code, language=language, project_context=_compact_context(project_context))
     messages = [{"role": "user", "content": prompt}]
     try:
-        result = _call_nvidia(messages, api_data=api_data)
-        logger.info(f"[LLM] Generated new {language} test suite")
-        return _strip_markdown(result)
+        floor, ceiling = TESTS_MAX_TOKENS
+        result = _call_nvidia(messages, api_data=api_data, max_tokens=min(ceiling, max(floor, len(source_code) // 2)))
+        logger.info("[LLM] Generated new %s test suite", language)
+        suite = _strip_markdown(result)
+        if suite:
+            _cache_put(_tests_cache, cache_key, suite)
+        return suite
     except Exception as exc:
-        logger.error(f"[LLM] Test generation failed for {language}: {exc}")
+        logger.error("[LLM] Test generation failed for %s: %s", language, exc)
         return f"// Generation failed\n// {exc}"
 
 
 # ── Private helper ────────────────────────────────────────────────────────
 
-def _call_nvidia(messages: list[dict], api_data: dict | None = None) -> str:
+def clear_response_cache() -> None:
+    """Forget every cached LLM answer, in memory and on disk."""
+    with _cache_lock:
+        for cache in (_fix_cache, _commit_msg_cache, _tests_cache):
+            cache.clear()
+    llm_cache.clear()
+
+
+def _cache_key(*parts) -> str:
+    return llm_cache.cache_key(*parts)
+
+
+def _fix_cache_key(
+    bug_type: str,
+    file_path: str,
+    line_number: int,
+    error_message: str,
+    original_code: str,
+    project_context: str,
+    api_data: dict | None,
+) -> str:
+    """Cache key for one fix: the failure, the code, the context and the endpoint it was asked of."""
+    return _cache_key(
+        "fix", bug_type, file_path, line_number, error_message,
+        _digest(original_code), _digest(project_context or ""), _endpoint_tag(api_data),
+    )
+
+
+def _endpoint_tag(api_data: dict | None) -> str:
+    """base_url + model the request resolves to, so answers from different endpoints never mix."""
+    cfg = _resolve_endpoint(api_data)
+    return f"{cfg.base_url}|{cfg.model}"
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8", "replace"), digest_size=32).hexdigest()
+
+
+def _cache_get(cache: OrderedDict, key: str) -> str | None:
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            return value
+    # Memory miss: try the persistent cache and promote a hit
+    value = llm_cache.get(key)
+    if value is not None:
+        _cache_put(cache, key, value, persist=False)
+    return value
+
+
+def _cache_put(cache: OrderedDict, key: str, value: str, persist: bool = True) -> None:
+    if not RESPONSE_CACHE_ENABLED:
+        return
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > RESPONSE_CACHE_SIZE:
+            cache.popitem(last=False)
+    if persist:
+        llm_cache.put(key, value)
+
+
+def _join_inflight(key: str) -> tuple[Future, bool]:
+    """Return (future, is_leader): the leader computes and resolves it, others wait on it."""
+    with _cache_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future, False
+        future = _inflight[key] = Future()
+        return future, True
+
+
+def _leave_inflight(key: str) -> None:
+    with _cache_lock:
+        _inflight.pop(key, None)
+
+
+def _get_client(base_url: str, api_key: str) -> OpenAI:
+    """Return the shared client for (base_url, api_key), so its connection pool stays warm."""
+    key = (base_url, api_key)
+    with _client_lock:
+        client = _CLIENT_POOL.get(key)
+        if client is None:
+            client = _CLIENT_POOL[key] = OpenAI(base_url=base_url, api_key=api_key)
+        return client
+
+
+def _get_async_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """Like _get_client, but per running event loop (httpx async pools are loop-bound)."""
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        pool = _ASYNC_CLIENT_POOL.setdefault(loop, {})
+        client = pool.get((base_url, api_key))
+        if client is None:
+            client = pool[(base_url, api_key)] = AsyncOpenAI(base_url=base_url, api_key=api_key)
+        return client
+
+
+def _prefix_key(messages: list[dict]) -> str:
+    """Key for the stable part of a prompt: everything before its '## Task' section."""
+    first = messages[0].get("content", "") if messages else ""
+    return hashlib.sha1(first.split("## Task", 1)[0].encode("utf-8", "replace")).hexdigest()
+
+
+def _resolve_endpoint(api_data: dict | None) -> NvidiaConfig:
+    """Return the endpoint config, applying non-empty overrides from api_data."""
+    if not api_data:
+        return _DEFAULT_CFG
+    overrides = {k: v for k, v in api_data.items() if k in _CFG_FIELDS and v}
+    return replace(_DEFAULT_CFG, **overrides) if overrides else _DEFAULT_CFG
+
+
+def _completion_kwargs(messages: list[dict], base_url: str, model: str, stream: bool, max_tokens: int = DEFAULT_MAX_TOKENS) -> dict:
+    """Arguments for chat.completions.create, shared by the sync and async clients."""
+    kwargs = dict(
+        model=model,
+        messages=messages,
+        temperature=LLM_TEMPERATURE,
+        top_p=1,
+        max_tokens=max_tokens,
+        stream=stream,
+        # Streaming times out between chunks; a plain call waits for the whole answer
+        timeout=60 if stream else COMPLETION_TIMEOUT,
+    )
+    if urlparse(base_url).hostname == "api.openai.com":
+        # Route calls sharing a prompt prefix to the same cache shard (OpenAI-only knob;
+        # other OpenAI-compatible servers may reject unknown fields)
+        kwargs["extra_body"] = {"prompt_cache_key": _prefix_key(messages)}
+    return kwargs
+
+
+def _call_nvidia(
+    messages: list[dict],
+    api_data: dict | None = None,
+    stream: bool = False,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+) -> str:
     """
     Call the primary LLM API (default: NVIDIA).
     Supports dynamic overrides from api_data (key, base_url, model).
     'messages' should be a list of {"role": "system|user|assistant", "content": "..."}
+    Every caller wants the full text, so by default the answer is fetched in one
+    response instead of being reassembled from per-token chunks.
     """
-    api_key  = NVIDIA_API_KEY
-    base_url = NVIDIA_BASE_URL
-    model    = NVIDIA_MODEL
-
-    if api_data:
-        if api_data.get("api_key"):  api_key  = api_data["api_key"]
-        if api_data.get("base_url"): base_url = api_data["base_url"]
-        if api_data.get("model"):    model    = api_data["model"]
-
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-    )
+    # Compatibility: a single prompt string (old behavior) is wrapped as one user message
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    cfg = _resolve_endpoint(api_data)
+    client = _get_client(cfg.base_url, cfg.api_key)
+    kwargs = _completion_kwargs(messages, cfg.base_url, cfg.model, stream, max_tokens)
 
     try:
-        completion = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.5,
-            top_p=1,
-            max_tokens=2048,
-            stream=True,
-            timeout=60,
-        )
-
-        parts = []
+        time.sleep(_reserve_token(cfg.api_key))
+        try:
+            completion = client.chat.completions.create(**kwargs)
+        except RateLimitError as e:
+            time.sleep(_rate_limit_wait(cfg.api_key, cfg.base_url, e))
+            completion = client.chat.completions.create(**kwargs)
+        if not stream:
+            return _message_text(completion)
+
+        buf = io.StringIO()
         for chunk in completion:
             if not getattr(chunk, "choices", None):
                 continue
             delta_content = chunk.choices[0].delta.content
             if delta_content is not None:
-                parts.append(delta_content)
+                buf.write(delta_content)
+
+        return buf.getvalue().strip()
+    except Exception as e:
+        logger.error("[LLM] Primary API call failed: %s", e)
+        raise
+
+
+async def _call_nvidia_async(
+    messages: list[dict],
+    api_data: dict | None = None,
+    stream: bool = False,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+) -> str:
+    """_call_nvidia on AsyncOpenAI: awaits the network instead of blocking the event loop."""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    cfg = _resolve_endpoint(api_data)
+    client = _get_async_client(cfg.base_url, cfg.api_key)
+    kwargs = _completion_kwargs(messages, cfg.base_url, cfg.model, stream, max_tokens)
+
+    try:
+        await asyncio.sleep(_reserve_token(cfg.api_key))
+        try:
+            completion = await client.chat.completions.create(**kwargs)
+        except RateLimitError as e:
+            await asyncio.sleep(_rate_limit_wait(cfg.api_key, cfg.base_url, e))
+            completion = await client.chat.completions.create(**kwargs)
+        if not stream:
+            return _message_text(completion)
+
+        buf = io.StringIO()
+        async for chunk in completion:
+            if not getattr(chunk, "choices", None):
+                continue
+            delta_content = chunk.choices[0].delta.content
+            if delta_content is not None:
+                buf.write(delta_content)
 
-        return "".join(parts).strip()
+        return buf.getvalue().strip()
     except Exception as e:
-        logger.error(f"[LLM] Primary API call failed: {e}")
-        # Compatibility fallback: if it looks like a single string was passed (old behavior), try to wrap it
-        if isinstance(messages, str):
-            return _call_nvidia([{"role": "user", "content": messages}], api_data=api_data)
-        raise e
+        logger.error("[LLM] Primary API call failed: %s", e)
+        raise
+
+
+def _reserve_token(api_key: str) -> float:
+    """Take one token from api_key's bucket; return how long to sleep before using it."""
+    now = time.monotonic()
+    with _bucket_lock:
+        bucket = _buckets.setdefault(api_key, [float(RATE_LIMIT_CAPACITY), now])
+        tokens = min(RATE_LIMIT_CAPACITY, bucket[0] + (now - bucket[1]) * RATE_LIMIT_REFILL)
+        # Going negative reserves a future token, so concurrent callers queue in order
+        bucket[0], bucket[1] = tokens - 1, now
+    return 0.0 if tokens >= 1 else (1 - tokens) / RATE_LIMIT_REFILL
+
+
+def _rate_limit_wait(api_key: str, base_url: str, error: RateLimitError) -> float:
+    """Seconds to wait before retrying a 429, or re-raise it when Retry-After is too long."""
+    headers = error.response.headers if getattr(error, "response", None) is not None else {}
+    wait = 1.0 / RATE_LIMIT_REFILL
+    try:
+        if headers.get("retry-after-ms"):
+            wait = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after"):
+            wait = float(headers["retry-after"])
+    except ValueError:
+        wait = RATE_LIMIT_MAX_WAIT + 1   # HTTP-date form: treat as a long back-off
+    if wait > RATE_LIMIT_MAX_WAIT:
+        logger.warning("[LLM] Rate limited by %s; Retry-After %.0fs is too long", base_url, wait)
+        raise error
+    # Drain the bucket so other callers on this key back off as well
+    with _bucket_lock:
+        bucket = _buckets.get(api_key)
+        if bucket is not None:
+            bucket[0] = min(bucket[0], 0.0)
+    logger.warning("[LLM] Rate limited by %s; retrying in %.1fs", base_url, wait)
+    return max(wait, 0.0)
+
+
+def _message_text(completion) -> str:
+    """Text of a non-streamed chat completion ('' if the provider returned no choices)."""
+    if not getattr(completion, "choices", None):
+        return ""
+    return (completion.choices[0].message.content or "").strip()
+
+
+def _call_fix_batch(jobs: list[dict], api_data: dict | None) -> list[str] | None:
+    """One tuple-batched fix call; returns the fixed files in order, or None if unusable."""
+    items = "\n\n".join(
+        _render(
+            _BATCH_ITEM_TMPL,
+            index=n,
+            bug_type=job["bug_type"],
+            file_path=job["file_path"],
+            line_number=job["line_number"],
+            error_message=job["error_message"],
+            original_code=job["original_code"],
+        )
+        for n, job in enumerate(jobs, 1)
+    )
+    messages = [{"role": "user", "content": _render(_BATCH_FIX_TMPL, items=items)}]
+    try:
+        logger.info("[LLM] Requesting %s batched fixes...", len(jobs))
+        budget = sum(_fix_max_tokens(job["original_code"]) for job in jobs)
+        raw = _call_nvidia(messages, api_data=api_data, max_tokens=min(BATCH_MAX_TOKENS, budget))
+    except Exception as exc:
+        logger.warning("[LLM] Batched fix call failed: %s. Fixing one by one.", exc)
+        return None
+
+    text = raw.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        fixed = json.loads(text)
+    except ValueError:
+        logger.warning("[LLM] Batched fix answer is not valid JSON. Fixing one by one.")
+        return None
+    if not isinstance(fixed, list) or len(fixed) != len(jobs) or not all(isinstance(c, str) for c in fixed):
+        logger.warning("[LLM] Batched fix answer has the wrong shape. Fixing one by one.")
+        return None
+    # Blank entries are failed answers; keep those files unchanged
+    return [code if code.strip() else job["original_code"] for code, job in zip(map(_strip_markdown, fixed), jobs)]
+
+
+def _fix_max_tokens(original_code: str) -> int:
+    """Output cap for a fix: the file's approx. token count (len // 4) plus 25% for edits and comments."""
+    floor, ceiling = FIX_MAX_TOKENS
+    return min(ceiling, max(floor, int(len(original_code) // 4 * 1.25)))
+
+
+def _fix_prompt(
+    bug_type: str,
+    file_path: str,
+    line_number: int,
+    error_message: str,
+    original_code: str,
+    project_context: str,
+) -> str:
+    return _render(
+        _FIX_TMPL,
+        bug_type=bug_type,
+        file_path=file_path,
+        line_number=line_number,
+        error_message=error_message,
+        original_code=original_code,
+        project_context=_compact_context(project_context),
+    )
+
+
+def _check_fix_input(file_path: str, original_code: str) -> None:
+    if len(original_code) > MAX_FIX_INPUT_CHARS:
+        raise ValueError(
+            f"{file_path} is too large to fix ({len(original_code)} chars > {MAX_FIX_INPUT_CHARS}); split it up"
+        )
+
+
+def _focus(file_path: str, line_number: int, original_code: str) -> tuple[str, int, tuple[int, int] | None]:
+    """
+    For a Python file over FOCUS_FIX_INPUT_CHARS, narrow the fix to the top-level
+    def/class containing *line_number*. Returns (code, line_number, span) to prompt
+    with; span is the 0-based [start, end) line slice, or None to send the whole file.
+    """
+    whole = (original_code, line_number, None)
+    if len(original_code) <= FOCUS_FIX_INPUT_CHARS or not file_path.endswith(".py"):
+        return whole
+    try:
+        line = int(line_number)
+        tree = ast.parse(original_code)
+    except (TypeError, ValueError, SyntaxError):
+        return whole
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            if start <= line <= node.end_lineno:
+                lines = original_code.splitlines(keepends=True)
+                return "".join(lines[start - 1:node.end_lineno]), line - start + 1, (start - 1, node.end_lineno)
+    return whole
+
+
+def _unfocus(original_code: str, span: tuple[int, int] | None, fixed: str) -> str:
+    """Splice a fixed snippet from _focus back into the full file."""
+    if span is None:
+        return fixed
+    if not fixed.strip():
+        return original_code
+    lines = original_code.splitlines(keepends=True)
+    start, end = span
+    return "".join(lines[:start]) + fixed.rstrip("\n") + "\n" + "".join(lines[end:])
+
+
+def _local_fix(bug_type: str, error_message: str, original_code: str) -> str | None:
+    """
+    Fix trivial cases without the LLM: an "unused import" lint error whose top-level
+    import sits alone on exactly one line has that line removed ("" if that was the
+    whole file). Returns None when the LLM is needed (including empty files, which
+    agents asks it to create).
+    """
+    if bug_type != "LINTING" or not original_code.strip():
+        return None
+    m = _UNUSED_IMPORT_RE.search(error_message)
+    if not m:
+        return None
+    name = re.escape(m.group(1) or m.group(2))
+    line_re = re.compile(
+        rf"^(?:import {name}|from [\w.]+ import {name.rsplit('.', 1)[-1]})[ \t]*(?:#.*)?(?:\n|$)",
+        re.MULTILINE,
+    )
+    fixed, count = line_re.subn("", original_code)
+    return fixed if count == 1 else None
+
+
+def _compact_context(text: str) -> str:
+    """
+    Drop blank and comment-only lines from a project context and cap it at
+    PROJECT_CONTEXT_MAX_TOKENS, cutting at a line boundary. Memoized per context.
+    """
+    if not text:
+        return text
+    key = _digest(text)
+    with _cache_lock:
+        compact = _compact_context_cache.get(key)
+        if compact is not None:
+            _compact_context_cache.move_to_end(key)
+            return compact
+
+    compact = _NOISE_LINE_RE.sub("", text if text.endswith("\n") else text + "\n")
+    limit = PROJECT_CONTEXT_MAX_TOKENS * 4
+    if len(compact) > limit:
+        compact = compact[:compact.rfind("\n", 0, limit) + 1]
+
+    with _cache_lock:
+        _compact_context_cache[key] = compact
+        while len(_compact_context_cache) > 64:
+            _compact_context_cache.popitem(last=False)
+    return compact
+
+
+def _ollama_fix(prompt: str, file_path: str, line_number: int, original_code: str) -> str:
+    """Ask the local Ollama fallback for a fix; returns *original_code* if that fails too."""
+    try:
+        resp = _OLLAMA_HTTP.post("/api/generate", json=_ollama_payload(prompt))
+        resp.raise_for_status()
+        result = _strip_markdown(resp.json().get("response", "").strip())
+        if result.strip():
+            logger.info("[LLM] Ollama fix generated for %s:%s", file_path, line_number)
+            return result
+        logger.error("[LLM] Ollama returned an empty fix. Returning original code.")
+    except Exception as ollama_err:
+        logger.error("[LLM] Ollama also failed: %s. Returning original code.", ollama_err)
+
+    return original_code
+
+
+def _ollama_payload(prompt: str) -> dict:
+    return {"model": OLLAMA_MODEL, "prompt": prompt, "stream": False}
 
 
 def _strip_markdown(text: str) -> str:
@@ -217,46 +872,14 @@ def _strip_markdown(text: str) -> str:
     context markers or headers from the LLM response.
     """
     text = text.strip()
-    
-    # 1. Handle markdown code fences if LLM ignored instructions
-    if "```" in text:
-        try:
-            parts = text.split("```")
-            if len(parts) >= 2:
-                # The code is between the first and second ```
-                content = parts[1]
-                # Split at first newline to remove potential language tag (e.g. ```python)
-                lines = content.splitlines()
-                if lines and (lines[0].strip().lower() in ("python", "javascript", "js", "ts", "typescript", "jsx", "tsx", "html", "css")):
-                    text = "\n".join(lines[1:]).strip()
-                else:
-                    text = content.strip()
-        except Exception:
-            pass
-
-    # 2. Aggressively remove leaked context markers and headers
-    lines = text.splitlines()
-    cleaned_lines = []
-    ignoring = False
-    
-    # Common headers to strip
-    bad_starts = (
-        "--- File:", 
-        "[[[ CONTEXT_FILE:", 
-        "Full Project Source Code Context:", 
-        "Here is the fixed code",
-        "```", # Extra fences
-    )
 
-    for line in lines:
-        sline = line.strip()
-        
-        # If we see a marker for a DIFFERENT file, we might be in a multi-file bounce
-        # But per prompt, they should only return one. 
-        # If we see a marker, skip that line.
-        if any(sline.startswith(b) for b in bad_starts):
-            continue
-            
-        cleaned_lines.append(line)
+    # 1. Handle markdown code fences if LLM ignored instructions:
+    #    keep what's between the first two fences, minus a known language tag.
+    #    Most answers have none, so skip the regex unless a fence is present.
+    if "```" in text:
+        m = _FENCE_RE.search(text)
+        if m:
+            text = m.group(1).strip()
 
-    return "\n".join(cleaned_lines).strip()
+    # 2. Aggressively remove leaked context markers and headers (whole lines)
+    return _LEAKED_LINE_RE.sub("", text).strip()
@@ -14,34 +14,49 @@ Endpoints:
 """
 
 import os
+import re
 import uuid
+import codecs
+import io
+import stat
+import hashlib
+import locale
+import functools
+import importlib.util
 import shutil
 import logging
 import zipfile
 import threading
 import sqlite3
-import json
+import queue
 import asyncio
 import subprocess
 import time
 import platform
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional
 
+import orjson
 from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, BackgroundTasks
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from agents import run_pipeline
-from llm_client import _call_nvidia, _strip_markdown
+from docker_runner import release_sandbox
+from llm_client import _call_nvidia_async, _strip_markdown
 from git_utils import (
     clone_repo, 
     create_branch, 
     commit_and_push, 
     get_all_files, 
     get_clone_path,
+    forget_cached_files,
+    sweep_trash,
+    CLONES_DIR as GIT_CLONES_DIR,
     commit_changes,
     push_changes
 )
@@ -49,7 +64,11 @@ from git_utils import (
 # ---------------------------------------------------------------------------
 # Database & Path Initialization
 # ---------------------------------------------------------------------------
-from state import ROOT_DIR, runs, RUN_PATHS, save_projects, load_projects
+from state import (
+    ROOT_DIR, runs, RUNS_LOCK, RUN_PATHS, RUN_PATHS_RESOLVED,
+    TerminalBuffer, run_lock, append_terminal_output, terminal_text,
+    save_projects, flush_projects, load_projects,
+)
 
 if getattr(sys, 'frozen', False):
     APP_DATA = ROOT_DIR
@@ -64,23 +83,128 @@ CLONES_DIR.mkdir(parents=True, exist_ok=True)
 
 
 
+# WAL lets history reads run alongside chat inserts; NORMAL sync skips the fsync per commit
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
+
+
+# Connections are reused across requests: one writer (SQLite allows a single writer
+# anyway) behind a lock, and up to READ_POOL_SIZE read-only connections for history reads
+READ_POOL_SIZE = os.cpu_count() or 4
+_write_conn: sqlite3.Connection | None = None
+_write_lock = threading.Lock()
+_read_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+_read_slots = threading.BoundedSemaphore(READ_POOL_SIZE)
+
+
+def _connect(readonly: bool = False) -> sqlite3.Connection:
+    """Open the chat DB in autocommit mode with the PRAGMAs above applied."""
+    if readonly:
+        conn = sqlite3.connect(f"{DB_PATH.resolve().as_uri()}?mode=ro", uri=True,
+                               isolation_level=None, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+    for pragma in SQLITE_PRAGMAS:
+        if readonly and "journal_mode" in pragma:
+            continue  # set by the writer; a read-only connection can't change it
+        conn.execute(pragma)
+    return conn
+
+
+@contextmanager
+def write_conn():
+    """Borrow the shared write connection; an unfinished transaction is rolled back."""
+    global _write_conn
+    with _write_lock:
+        if _write_conn is None:
+            _write_conn = _connect()
+        try:
+            yield _write_conn
+        finally:
+            if _write_conn.in_transaction:
+                _write_conn.rollback()
+
+
+@contextmanager
+def read_conn():
+    """Borrow a pooled read-only connection (opened on first use, at most READ_POOL_SIZE)."""
+    with _read_slots:
+        try:
+            conn = _read_pool.get_nowait()
+        except queue.Empty:
+            conn = _connect(readonly=True)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            _read_pool.put(conn)
+
+
+def _read_all(sql: str, params: tuple = ()) -> list[tuple]:
+    with read_conn() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def _execute(sql: str, params: tuple = ()) -> None:
+    with write_conn() as conn:
+        conn.execute(sql, params)
+
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS chat_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            run_id TEXT NOT NULL,
-            session_id TEXT,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                session_id TEXT,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Serves the per-session history queries (either order) and, via its
+        # run_id prefix, the DISTINCT session_id listing
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_run_sess_ts ON chat_messages(run_id, session_id, timestamp)")
+        conn.execute("ANALYZE")
 
 
+# ---------------------------------------------------------------------------
+# Precompiled patterns
+# ---------------------------------------------------------------------------
+_BRANCH_UNSAFE_RE = re.compile(r"[^A-Za-z0-9 ]")
+# Chat agent: @mentions and the tool calls parsed out of each LLM response
+_MENTION_RE = re.compile(r"\[([a-zA-Z0-9_/.-]+)\]")
+_MSG_TOKEN_RE = re.compile(r"[\w./-]+")
+_FOLDER_RE = re.compile(
+    r"(?:CREATE_FOLDER:|MKDIR:|CREATE_DIRECTORY:)\s*([a-zA-Z0-9_/.\\-]+)/?\s*(?:\n|$)|(?:CREATE_FILE:|WRITE_FILE:)\s*([a-zA-Z0-9_/.\\-]+[/\\])\s*(?:\n|$)",
+    re.IGNORECASE,
+)
+_FILE_BLOCK_SPLIT_RE = re.compile(r"(?=CREATE_FILE:|WRITE_FILE:)", re.IGNORECASE)
+_FILE_NAME_RE = re.compile(r"(?:CREATE_FILE:|WRITE_FILE:)\s*([a-zA-Z0-9_/.\\-]+)", re.IGNORECASE)
+_FENCED_BODY_RE = re.compile(r"```(?:\w+)?\n(.*?)\n```", re.DOTALL)
+_PUSH_RE = re.compile(r"PUSH_TO_GITHUB:\s*(true|yes)", re.IGNORECASE)
+_RUN_COMMAND_RE = re.compile(r"RUN_COMMAND:\s*([^\n]+)", re.IGNORECASE)
+
+# /terminal: "cd [/d] <dir>" is handled in-process; anything with shell syntax goes to the shell
+_CD_RE = re.compile(r"^cd(?:\s+/d)?(?:\s+(.+))?$", re.IGNORECASE)
+_SHELL_META_RE = re.compile(r"""[|&;<>()$`\\"'*?\[\]~{}%^!\n]""")
+
+# Folder picker: system / dependency dirs not worth listing (plus anything starting with "." or "$")
+_BROWSE_SKIP_DIRS = frozenset({"AppData", "Program Files", "Windows", "node_modules", "vendor"})
+
+# ZIP download: VCS, dependency, cache and build-output dirs are pruned from the walk
+_ZIP_SKIP_DIRS = frozenset({
+    ".git", "node_modules", "__pycache__", ".venv", "venv", "dist", "build",
+    ".next", ".cache", ".mypy_cache", ".pytest_cache",
+})
+_ZIP_SKIP_FILE_RE = re.compile(r"\.(?:pyc|pyo|log)$", re.IGNORECASE)
+
 # ---------------------------------------------------------------------------
 # Logging
 # ---------------------------------------------------------------------------
@@ -93,7 +217,23 @@ logger = logging.getLogger(__name__)
 # ---------------------------------------------------------------------------
 # App Initialization
 # ---------------------------------------------------------------------------
-app = FastAPI(title="CI/CD Healing Agent API", version="1.0.0")
+# orjson encodes the large terminal buffers and file listings far faster than stdlib json
+app = FastAPI(title="CI/CD Healing Agent API", version="1.0.0", default_response_class=ORJSONResponse)
+
+# Threads for blocking work (SQLite, filesystem walks, rmtree) offloaded from handlers
+BLOCKING_WORKERS = 32
+
+@app.on_event("startup")
+async def _configure_executor():
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+    )
+
+@app.on_event("startup")
+async def _sweep_clone_trash():
+    # Clone dirs renamed aside by a previous process that exited before deleting them
+    for clones_dir in {CLONES_DIR, GIT_CLONES_DIR}:
+        sweep_trash(clones_dir)
 
 @app.get("/health")
 async def health_check():
@@ -193,6 +333,32 @@ class ChatRequest(BaseModel):
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
+_clone_dirs: dict[str, Path] = {}   # run_id prefix -> clone dir; scanned once, then kept up to date
+_clone_dirs_scanned = False
+
+def _scan_clone_dirs() -> dict[str, Path]:
+    """Rebuild _clone_dirs from one CLONES_DIR listing."""
+    global _clone_dirs_scanned
+    scanned = {}
+    if CLONES_DIR.exists():
+        for item in CLONES_DIR.iterdir():
+            # Dot-dirs are _discard_dir trash, not clones
+            if item.is_dir() and not item.name.startswith("."):
+                scanned.setdefault(item.name.split('_')[0], item)
+    _clone_dirs.clear()
+    _clone_dirs.update(scanned)
+    _clone_dirs_scanned = True
+    return _clone_dirs
+
+def _clone_dir(run_id: str) -> Path | None:
+    """Clone dir for *run_id* from the index (scans CLONES_DIR on first use only)."""
+    index = _clone_dirs if _clone_dirs_scanned else _scan_clone_dirs()
+    path = index.get(run_id)
+    if path is not None and not path.is_dir():
+        index.pop(run_id, None)
+        return None
+    return path
+
 def get_repo_path(run_id: str) -> Path | None:
     """Resolve the physical disk path for a given run_id."""
     logger.info(f"[DEBUG] get_repo_path checking run_id: '{run_id}'")
@@ -202,54 +368,123 @@ def get_repo_path(run_id: str) -> Path | None:
     
     logger.info(f"[DEBUG] Not in RUN_PATHS. Keys: {list(RUN_PATHS.keys())}")
     
-    # Fallback to scanning CLONES_DIR (for past sessions or cloned repos)
-    if not CLONES_DIR.exists():
-        return None
-        
+    # Fallback to the CLONES_DIR index (for past sessions or cloned repos)
     try:
-        # Check if run_id is a prefix of any directory in CLONES_DIR
-        for item in CLONES_DIR.iterdir():
-            if item.is_dir():
-                prefix = item.name.split('_')[0]
-                if prefix == run_id:
-                    return item
-        return None
+        return _clone_dir(run_id)
     except Exception:
         return None
 
-def add_chat_message(run_id: str, session_id: str, role: str, content: str):
-    """Save a chat message to both the central DB and the workspace-specific history file."""
+def _resolved_root(run_id: str, root: Path) -> Path:
+    """Resolved form of a project root from get_repo_path, cached per run_id."""
+    resolved = RUN_PATHS_RESOLVED.get(run_id)
+    if resolved is None:
+        resolved = RUN_PATHS_RESOLVED[run_id] = root.resolve()
+    return resolved
+
+@functools.lru_cache(maxsize=512)
+def _resolve_cwd(cwd: str) -> str:
+    """str(Path(cwd).resolve()) for terminal working dirs, memoized (cleared on project delete)."""
+    return str(Path(cwd).resolve())
+
+async def _awrite_text(path: Path, content: str):
+    """Create parent dirs and write *content* on a worker thread, off the event loop."""
+    def write():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+    await asyncio.to_thread(write)
+
+def _decode_output(data: bytes) -> str:
+    """Decode captured output the way subprocess.run(text=True) does (locale codec, universal newlines)."""
+    text = data.decode(locale.getpreferredencoding(False), errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+async def _run_process(cmd, *, cwd, shell: bool, timeout: float) -> subprocess.CompletedProcess:
+    """subprocess.run(capture_output=True, text=True) on asyncio pipes, with no worker thread per command."""
+    flags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+    pipes = {"stdout": asyncio.subprocess.PIPE, "stderr": asyncio.subprocess.PIPE}
+    if shell:
+        proc = await asyncio.create_subprocess_shell(cmd, cwd=cwd, creationflags=flags, **pipes)
+    else:
+        proc = await asyncio.create_subprocess_exec(*cmd, cwd=cwd, creationflags=flags, **pipes)
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return subprocess.CompletedProcess(cmd, proc.returncode, _decode_output(stdout), _decode_output(stderr))
+
+def _batch_insert(conn: sqlite3.Connection, rows: list[tuple]):
+    """Insert (run_id, session_id, role, content) rows with one executemany in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany("INSERT INTO chat_messages (run_id, session_id, role, content) VALUES (?, ?, ?, ?)", rows)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def add_chat_messages(run_id: str, session_id: str, messages: list[tuple[str, str]]):
+    """Save (role, content) messages to both the central DB and the workspace-specific history file."""
+    if not messages:
+        return
     try:
         # 1. Central SQLite DB
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("INSERT INTO chat_messages (run_id, session_id, role, content) VALUES (?, ?, ?, ?)",
-                    (run_id, session_id, role, content))
-        conn.commit()
-        conn.close()
+        with write_conn() as conn:
+            _batch_insert(conn, [(run_id, session_id, role, content) for role, content in messages])
 
         # 2. Workspace-specific JSON file (mirror)
-        repo_path = get_repo_path(run_id)
-        if repo_path and repo_path.exists():
-            history_dir = repo_path / ".gguai"
-            history_dir.mkdir(exist_ok=True)
-            history_file = history_dir / "chat_history.json"
-            
-            history = []
-            if history_file.exists():
-                try:
-                    history = json.loads(history_file.read_text(encoding="utf-8"))
-                except: pass
-            
-            history.append({
-                "role": role,
-                "content": content,
-                "session_id": session_id,
-                "timestamp": datetime.now().isoformat()
-            })
-            history_file.write_text(json.dumps(history, indent=2), encoding="utf-8")
+        _mirror_chat_messages(run_id, session_id, messages)
     except Exception as e:
-        logger.warning(f"Failed to add chat message for {run_id}: {e}")
+        logger.warning(f"Failed to add chat messages for {run_id}: {e}")
+
+def add_user_message_and_history(run_id: str, session_id: str, message: str | None, limit: int = 20) -> list[tuple[str, str]]:
+    """
+    Store the user's *message* (if any) and return the last *limit* (role, content) rows
+    of the session, oldest first. The INSERT and SELECT share one IMMEDIATE transaction,
+    so the write lock is taken once up front and released before the LLM call.
+    """
+    # id breaks ties between rows written in the same second (e.g. one batch)
+    query = "SELECT role, content FROM chat_messages WHERE run_id = ? AND session_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?"
+    if message is None:
+        with read_conn() as conn:
+            rows = conn.execute(query, (run_id, session_id, limit)).fetchall()
+    else:
+        with write_conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT INTO chat_messages (run_id, session_id, role, content) VALUES (?, ?, ?, ?)",
+                         (run_id, session_id, "user", message))
+            rows = conn.execute(query, (run_id, session_id, limit)).fetchall()
+            conn.execute("COMMIT")
+        try:
+            _mirror_chat_messages(run_id, session_id, [("user", message)])
+        except Exception as e:
+            logger.warning(f"Failed to mirror chat message for {run_id}: {e}")
+    rows.reverse()
+    return rows
+
+def _mirror_chat_messages(run_id: str, session_id: str, messages: list[tuple[str, str]]):
+    """Append (role, content) messages to the workspace's .gguai/chat_history.json, if the workspace exists."""
+    repo_path = get_repo_path(run_id)
+    if repo_path and repo_path.exists():
+        history_dir = repo_path / ".gguai"
+        history_dir.mkdir(exist_ok=True)
+        history_file = history_dir / "chat_history.json"
+        
+        history = []
+        if history_file.exists():
+            try:
+                history = orjson.loads(history_file.read_bytes())
+            except: pass
+        
+        timestamp = datetime.now().isoformat()
+        history.extend({
+            "role": role,
+            "content": content,
+            "session_id": session_id,
+            "timestamp": timestamp
+        } for role, content in messages)
+        history_file.write_bytes(orjson.dumps(history, option=orjson.OPT_INDENT_2))
 
 def detect_project_type(repo_path: Path) -> dict:
     """Analyze the root directory and subdirectories to identify project type and its true root."""
@@ -299,42 +534,77 @@ def detect_project_type(repo_path: Path) -> dict:
         
     return {"type": "Generic / Unknown", "root": "."}
     
+class MockRepo:
+    """Stand-in for git.Repo on plain (non-git) folders; get_all_files only needs working_dir."""
+    def __init__(self, p): self.working_dir = str(p)
+
+_repo_cache: dict[str, object] = {}   # run_id -> git.Repo (or MockRepo) for its project root
+
+def open_repo(run_id: str, repo_path: Path):
+    """Return a cached git.Repo for the run (MockRepo if the folder isn't a git repo)."""
+    repo_obj = _repo_cache.get(run_id)
+    if repo_obj is not None and repo_obj.working_dir == str(repo_path):
+        return repo_obj
+    from git import Repo
+    try:
+        repo_obj = _repo_cache[run_id] = Repo(repo_path)
+    except Exception:
+        # Not cached: the folder may still become a git repo (e.g. `git init` in the terminal)
+        repo_obj = MockRepo(repo_path)
+    return repo_obj
+
 def refresh_run_files(run_id: str, repo_path: Path) -> list[dict]:
     """Helper to refresh the file list for a run, supporting both git and non-git projects."""
     from git_utils import get_all_files
     try:
-        from git import Repo
-        try:
-            repo_obj = Repo(repo_path)
-        except Exception:
-            class MockRepo:
-                def __init__(self, p): self.working_dir = str(p)
-            repo_obj = MockRepo(repo_path)
-            
-        files = get_all_files(repo_obj)
+        files = get_all_files(open_repo(run_id, repo_path))
         if run_id in runs:
-            runs[run_id].setdefault("live", {})["files"] = files
+            with run_lock(run_id):
+                runs[run_id].setdefault("live", {})["files"] = files
         return files
     except Exception as e:
         logger.error(f"Failed to refresh files for {run_id}: {e}")
         return []
 
+def update_run_files(run_id: str, repo_path: Path, rel_paths: list[str]) -> list[dict] | None:
+    """
+    Re-read only *rel_paths* (repo-relative, '/'-separated) into the run's cached file
+    list instead of walking the whole tree. Returns None if there is no list to update.
+    """
+    run = runs.get(run_id)
+    if not run or not run.get("live", {}).get("files"):
+        return None
+    with run_lock(run_id):
+        files = run["live"]["files"]
+        index = {f["path"]: i for i, f in enumerate(files)}
+        for rel in rel_paths:
+            try:
+                entry = {"path": rel, "content": (repo_path / rel).read_text(encoding="utf-8", errors="replace")}
+            except OSError:
+                continue
+            if rel in index:
+                files[index[rel]] = entry
+            else:
+                index[rel] = len(files)
+                files.append(entry)
+    return files
+
 def import_chat_history(run_id: str, repo_path: Path):
     """Try to import chat history from the workspace folder if empty in the central DB."""
     history_file = repo_path / ".gguai" / "chat_history.json"
     if not history_file.exists(): return
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT count(*) FROM chat_messages WHERE run_id = ?", (run_id,))
-        if c.fetchone()[0] == 0:
-            history = json.loads(history_file.read_text(encoding="utf-8"))
-            for msg in history:
-                c.execute("INSERT INTO chat_messages (run_id, session_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
-                            (run_id, msg.get("session_id", "default"), msg["role"], msg["content"], msg.get("timestamp")))
-            conn.commit()
-        conn.close()
+        with write_conn() as conn:
+            c = conn.cursor()
+            c.execute("SELECT count(*) FROM chat_messages WHERE run_id = ?", (run_id,))
+            if c.fetchone()[0] == 0:
+                history = orjson.loads(history_file.read_bytes())
+                c.execute("BEGIN")  # autocommit connection: one transaction for the whole import
+                c.executemany("INSERT INTO chat_messages (run_id, session_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                              [(run_id, msg.get("session_id", "default"), msg["role"], msg["content"], msg.get("timestamp"))
+                               for msg in history])
+                conn.commit()
     except Exception as e:
         logger.warning(f"Import history failed for {run_id}: {e}")
 
@@ -344,8 +614,8 @@ def maybe_auto_commit(run_id: str, message: str):
     if not repo_path: return
     
     try:
-        from git import Repo
-        repo = Repo(repo_path)
+        repo = open_repo(run_id, repo_path)
+        if isinstance(repo, MockRepo): return
         # Check if it has a remote called 'origin' to determine if it's a cloned repo
         if not repo.remotes or 'origin' not in [r.name for r in repo.remotes]:
             return
@@ -356,11 +626,18 @@ def maybe_auto_commit(run_id: str, message: str):
         logger.warning(f"[Auto-Commit] Failed for {run_id}: {e}")
 
 def derive_branch_name(team_name: str, leader_name: str) -> str:
-    import re
-    team = re.sub(r"[^A-Za-z0-9 ]", "", team_name).strip().upper().replace(" ", "_")
-    leader = re.sub(r"[^A-Za-z0-9 ]", "", leader_name).strip().upper().replace(" ", "_")
+    team = _BRANCH_UNSAFE_RE.sub("", team_name).strip().upper().replace(" ", "_")
+    leader = _BRANCH_UNSAFE_RE.sub("", leader_name).strip().upper().replace(" ", "_")
     return f"{team}_{leader}_AI_Fix"
 
+# Bounded pool for pipeline runs; extra /analyze requests queue instead of each getting a thread
+PIPELINE_EXECUTOR = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="pipeline")
+
+@app.on_event("shutdown")
+async def _stop_pipelines():
+    PIPELINE_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    flush_projects()
+
 def _background_run(run_id: str, repo_url: str, team_name: str, leader_name: str, branch_name: str):
     runs[run_id]["status"] = "running"
     try:
@@ -387,7 +664,7 @@ def _background_run(run_id: str, repo_url: str, team_name: str, leader_name: str
 # Endpoints
 # ---------------------------------------------------------------------------
 @app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze(req: AnalyzeRequest):
+async def analyze(req: AnalyzeRequest, background_tasks: BackgroundTasks):
     if not req.repo_url.startswith("http"):
         raise HTTPException(status_code=400, detail="repo_url must be a valid HTTP/HTTPS GitHub URL")
 
@@ -397,22 +674,27 @@ async def analyze(req: AnalyzeRequest):
     # Early registration of RUN_PATH to support terminal connection immediately
     clone_path = get_clone_path(req.repo_url, run_id, req.team_name, req.leader_name)
     RUN_PATHS[run_id] = clone_path
+    _clone_dirs[run_id] = clone_path
     save_projects()
 
-    runs[run_id] = {
-        "status": "running",
-        "team_name": req.team_name,
-        "leader_name": req.leader_name,
-        "live": {
-            "phase": "initializing",
-            "message": "Starting pipeline...",
-            "files": [],
-            "terminal_output": "",
-            "iterations": []
+    with RUNS_LOCK:
+        runs[run_id] = {
+            "status": "running",
+            "team_name": req.team_name,
+            "leader_name": req.leader_name,
+            "live": {
+                "phase": "initializing",
+                "message": "Starting pipeline...",
+                "files": [],
+                "terminal_output": TerminalBuffer(),
+                "iterations": []
+            }
         }
-    }
 
-    threading.Thread(target=_background_run, args=(run_id, req.repo_url, req.team_name, req.leader_name, branch_name), daemon=True).start()
+    # Submitted after the response is sent
+    background_tasks.add_task(
+        PIPELINE_EXECUTOR.submit, _background_run, run_id, req.repo_url, req.team_name, req.leader_name, branch_name,
+    )
     return AnalyzeResponse(run_id=run_id, message="Agent started", branch_name=branch_name)
 
 @app.post("/local/open")
@@ -428,23 +710,21 @@ async def open_local_folder(req: LocalOpenRequest):
     
     from git_utils import get_all_files
     try:
-        class MockRepo:
-            def __init__(self, p): self.working_dir = str(p)
-        
         files = get_all_files(MockRepo(path))
         
-        runs[run_id] = {
-            "status": "completed",
-            "team_name": req.team_name,
-            "leader_name": req.leader_name,
-            "live": {
-                "phase": "done",
-                "message": f"Local project mounted: {path.name}",
-                "files": files,
-                "terminal_output": f">>> Mounted local folder: {path}\n",
-                "iterations": []
+        with RUNS_LOCK:
+            runs[run_id] = {
+                "status": "completed",
+                "team_name": req.team_name,
+                "leader_name": req.leader_name,
+                "live": {
+                    "phase": "done",
+                    "message": f"Local project mounted: {path.name}",
+                    "files": files,
+                    "terminal_output": TerminalBuffer(f">>> Mounted local folder: {path}\n"),
+                    "iterations": []
+                }
             }
-        }
         return {"run_id": run_id, "message": "Local folder mounted", "files": files}
     except Exception as e:
         logger.exception(f"Local mount failed: {e}")
@@ -466,13 +746,10 @@ async def browse_local_folders(req: BrowseFolderRequest):
 
         folders = []
         # Filter: Skip hidden folders and common system dirs for speed/safety
-        skip_patterns = {".", "$", "AppData", "Program Files", "Windows", "node_modules", "vendor"}
-        
         try:
             for item in start_path.iterdir():
                 if item.is_dir():
-                    if any(item.name.startswith(p) for p in [".", "$"]): continue
-                    if item.name in skip_patterns: continue
+                    if item.name[:1] in ".$" or item.name in _BROWSE_SKIP_DIRS: continue
                     folders.append({
                         "name": item.name,
                         "path": str(item.absolute()),
@@ -506,7 +783,7 @@ async def chat_with_agent(req: ChatRequest):
         if req.run_id:
             repo_path = get_repo_path(req.run_id)
             if repo_path:
-                project_type_info = detect_project_type(repo_path)
+                project_type_info = await asyncio.to_thread(detect_project_type, repo_path)
 
         project_type = project_type_info["type"]
         project_root = project_type_info["root"]
@@ -610,8 +887,11 @@ async def chat_with_agent(req: ChatRequest):
         full_requested = any(k in msg_lower for k in ["full code", "entire repo", "all files", "architecture summary", "project overview"])
         
         # Explicitly look for [path] patterns from @ mentions
-        import re
-        mentions = re.findall(r"\[([a-zA-Z0-9_/.-]+)\]", req.message)
+        mentions = [m.lower() for m in _MENTION_RE.findall(req.message)]
+        # Path-like words of the message for O(1) name lookups; "./src/app.py." also yields "src/app.py"
+        msg_tokens = set()
+        for t in _MSG_TOKEN_RE.findall(msg_lower):
+            msg_tokens.update((t, t.rstrip("."), t.removeprefix("./").rstrip(".")))
         
         if repo_files:
             for f in repo_files:
@@ -619,10 +899,11 @@ async def chat_with_agent(req: ChatRequest):
                 if not path or not content: continue
                 
                 # Check if this file is explicitly mentioned
-                is_mentioned = any(m.lower() in path.lower() for m in mentions)
+                path_lower = path.lower()
+                is_mentioned = any(m in path_lower for m in mentions)
                 
                 # Or implicitly mentioned by name
-                is_implicit = not mentions and (path.lower() in msg_lower or path.split("/")[-1].lower() in msg_lower)
+                is_implicit = not mentions and (path_lower in msg_tokens or path_lower.rsplit("/", 1)[-1] in msg_tokens)
 
                 if full_requested or is_mentioned or is_implicit:
                     # Avoid duplication if it's already the active file
@@ -634,6 +915,8 @@ async def chat_with_agent(req: ChatRequest):
 
         # LLM Logic with iterative tool use
         max_iterations = 30
+        written_files = []    # repo-relative paths written by CREATE_FILE / WRITE_FILE
+        ran_commands = False  # RUN_COMMAND may change anything, forcing a full rescan
         iteration = 0
         final_response = ""
         verification_log = []
@@ -648,16 +931,12 @@ async def chat_with_agent(req: ChatRequest):
 
             # Get history (for the first turn, we add the user message)
             try:
-                if iteration == 1:
-                    add_chat_message(req.run_id or "unknown", req.session_id or "default", "user", req.message)
-
-                conn = sqlite3.connect(DB_PATH)
-                c = conn.cursor()
                 # Fetch more history to provide better context for verification
-                c.execute("SELECT role, content FROM chat_messages WHERE run_id = ? AND session_id = ? ORDER BY timestamp DESC LIMIT 20",
-                          (req.run_id or "unknown", req.session_id or "default"))
-                history_rows = c.fetchall()
-                history_rows.reverse()
+                history_rows = await asyncio.to_thread(
+                    add_user_message_and_history,
+                    req.run_id or "unknown", req.session_id or "default",
+                    req.message if iteration == 1 else None,
+                )
                 for h in history_rows:
                     if h[0] == "agent":
                         role = "assistant"
@@ -667,7 +946,6 @@ async def chat_with_agent(req: ChatRequest):
                         content = f"[SYSTEM: {h[1]}]" if h[0] == "system" else h[1]
 
                     current_messages.append({"role": role, "content": content})
-                conn.close()
 
                 # Cleanup: Ensure strictly alternating user/assistant roles
                 # Step 1: Separate system instruction from history
@@ -701,10 +979,11 @@ async def chat_with_agent(req: ChatRequest):
                     current_messages.append({"role": "user", "content": req.message})
 
             # Call LLM
-            response = _call_nvidia(current_messages, api_data=req.api_data)
+            # Awaited on AsyncOpenAI so a slow completion doesn't stall the event loop
+            response = await _call_nvidia_async(current_messages, api_data=req.api_data)
 
-            # Persist agent response
-            add_chat_message(req.run_id or "unknown", req.session_id or "default", "agent", response)
+            # Agent response and this turn's tool feedback are persisted together below
+            turn_messages = [("agent", response)]
 
             # Accumulate the response
             if response.strip():
@@ -716,18 +995,17 @@ async def chat_with_agent(req: ChatRequest):
             tool_feedback = []
 
             # --- ACTION A: FOLDER CREATION ---
-            folder_pattern = r"(?:CREATE_FOLDER:|MKDIR:|CREATE_DIRECTORY:)\s*([a-zA-Z0-9_/.\\-]+)/?\s*(?:\n|$)|(?:CREATE_FILE:|WRITE_FILE:)\s*([a-zA-Z0-9_/.\\-]+[/\\])\s*(?:\n|$)"
             created_dirs = set()
-            for f_match in re.finditer(folder_pattern, response, re.IGNORECASE):
+            for f_match in _FOLDER_RE.finditer(response):
                 path_str = (f_match.group(1) or f_match.group(2)).strip()
                 if not path_str: continue
                 repo_path = get_repo_path(req.run_id)
                 if repo_path:
                     full_p = (repo_path / path_str).resolve()
-                    if str(full_p).startswith(str(repo_path.resolve())):
+                    if str(full_p).startswith(str(_resolved_root(req.run_id, repo_path))):
                         action_taken = True
                         try:
-                            full_p.mkdir(parents=True, exist_ok=True)
+                            await asyncio.to_thread(full_p.mkdir, parents=True, exist_ok=True)
                             created_dirs.add(str(full_p))
                             logger.info(f"[CHAT-AGENT] Created Directory: {path_str}")
                             tool_feedback.append(f"Successfully created directory: {path_str}")
@@ -739,19 +1017,19 @@ async def chat_with_agent(req: ChatRequest):
                         tool_feedback.append(f"Attempted to create directory outside project root: {path_str}")
 
             # --- ACTION B: FILE CREATION/MODIFICATION ---
-            file_blocks = re.split(r"(?=CREATE_FILE:|WRITE_FILE:)", response, flags=re.IGNORECASE)
+            file_blocks = _FILE_BLOCK_SPLIT_RE.split(response)
             for block in file_blocks:
                 if not block.strip().lower().startswith(("create_file:", "write_file:")):
                     continue
 
-                fn_match = re.search(r"(?:CREATE_FILE:|WRITE_FILE:)\s*([a-zA-Z0-9_/.\\-]+)", block, re.IGNORECASE)
+                fn_match = _FILE_NAME_RE.search(block)
                 if not fn_match: continue
                 target_file = fn_match.group(1).strip()
 
                 if target_file.endswith("/") or target_file.endswith("\\"): continue
 
                 content = ""
-                md_match = re.search(r"```(?:\w+)?\n(.*?)\n```", block, re.DOTALL)
+                md_match = _FENCED_BODY_RE.search(block)
                 if md_match:
                     content = md_match.group(1)
                 else:
@@ -779,17 +1057,17 @@ async def chat_with_agent(req: ChatRequest):
                     repo_path = get_repo_path(req.run_id)
                     if repo_path:
                         full_p = (repo_path / target_file).resolve()
-                        if str(full_p).startswith(str(repo_path.resolve())):
+                        if str(full_p).startswith(str(_resolved_root(req.run_id, repo_path))):
                             if full_p.is_dir():
                                 tool_feedback.append(f"Warning: Skipping file write for {target_file} as it is a directory.")
                                 continue
 
                             action_taken = True
                             try:
-                                full_p.parent.mkdir(parents=True, exist_ok=True)
-                                full_p.write_text(content, encoding="utf-8")
+                                await _awrite_text(full_p, content)
+                                written_files.append(full_p.relative_to(_resolved_root(req.run_id, repo_path)).as_posix())
                                 logger.info(f"[CHAT-AGENT] Created/Modified File: {target_file}")
-                                maybe_auto_commit(req.run_id, f"Auto-commit: Modified {target_file}")
+                                await asyncio.to_thread(maybe_auto_commit, req.run_id, f"Auto-commit: Modified {target_file}")
                                 tool_feedback.append(f"Successfully created/modified file: {target_file}")
                             except Exception as e:
                                 tool_success = False
@@ -799,25 +1077,22 @@ async def chat_with_agent(req: ChatRequest):
                             tool_feedback.append(f"Attempted to create/modify file outside project root: {target_file}")
 
             # --- ACTION C: Push Action ---
-            push_pattern = r"PUSH_TO_GITHUB:\s*(true|yes)"
-            if re.search(push_pattern, response, re.IGNORECASE) and req.run_id:
+            if _PUSH_RE.search(response) and req.run_id:
                 repo_path = get_repo_path(req.run_id)
                 if repo_path:
                     action_taken = True
                     try:
-                        from git import Repo
                         from state import GLOBAL_CONFIG
-                        repo_obj = Repo(repo_path)
+                        repo_obj = open_repo(req.run_id, repo_path)
                         pat = GLOBAL_CONFIG.get("github_pat") or os.getenv("GITHUB_PAT")
-                        push_changes(repo_obj, pat=pat)
+                        await asyncio.to_thread(push_changes, repo_obj, pat=pat)
                         tool_feedback.append("Successfully pushed changes to GitHub.")
                     except Exception as e:
                         tool_success = False
                         tool_feedback.append(f"Failed to push to GitHub: {str(e)}")
 
             # --- ACTION D: Terminal Commands ---
-            command_pattern = r"RUN_COMMAND:\s*([^\n]+)"
-            cmd_matches = list(re.finditer(command_pattern, response, re.IGNORECASE))
+            cmd_matches = list(_RUN_COMMAND_RE.finditer(response))
 
             if cmd_matches and req.run_id:
                 repo_path = get_repo_path(req.run_id)
@@ -874,6 +1149,7 @@ async def chat_with_agent(req: ChatRequest):
                             continue
 
                         logger.info(f"[CHAT-AGENT] Executing: {cmd}")
+                        ran_commands = True
                         try:
                             exec_cmd = cmd
                             if is_windows:
@@ -885,32 +1161,23 @@ async def chat_with_agent(req: ChatRequest):
                             if not cmd.lower().startswith("cd ") and project_type_info.get("root") and project_type_info["root"] != ".":
                                 initial_cwd = repo_path / project_type_info["root"]
 
-                            # Non-blocking execution using asyncio.to_thread
-                            import asyncio
-                            proc = await asyncio.to_thread(
-                                subprocess.run,
+                            # Non-blocking execution on asyncio pipes
+                            proc = await _run_process(
                                 exec_cmd,
                                 cwd=initial_cwd,
                                 shell=not is_windows,
-                                capture_output=True,
-                                text=True,
                                 timeout=20,  # Reduced to 20s as requested
-                                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
                             )
                             output = (proc.stdout + "\n" + proc.stderr).strip()
                             
                             # --- FALLBACK: If initial CWD failed, try clone root (only if we weren't already there) ---
                             if proc.returncode != 0 and initial_cwd != repo_path:
                                 logger.info(f"[CHAT-AGENT] Command failed in nested root, retrying in clone root: {repo_path}")
-                                proc_retry = await asyncio.to_thread(
-                                    subprocess.run,
+                                proc_retry = await _run_process(
                                     exec_cmd,
                                     cwd=repo_path,
                                     shell=not is_windows,
-                                    capture_output=True,
-                                    text=True,
                                     timeout=20,
-                                    creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
                                 )
                                 if proc_retry.returncode == 0:
                                     proc = proc_retry
@@ -927,8 +1194,9 @@ async def chat_with_agent(req: ChatRequest):
 
             # Add tool feedback to chat history as system messages
             for feedback_msg in tool_feedback:
-                add_chat_message(req.run_id or "unknown", req.session_id or "default", "system", feedback_msg)
+                turn_messages.append(("system", feedback_msg))
                 tool_output_messages.append(feedback_msg)
+            await asyncio.to_thread(add_chat_messages, req.run_id or "unknown", req.session_id or "default", turn_messages)
 
             # Update verification log
             verification_log.append({
@@ -958,7 +1226,11 @@ async def chat_with_agent(req: ChatRequest):
         if req.run_id:
             repo_path = get_repo_path(req.run_id)
             if repo_path:
-                updated_live = refresh_run_files(req.run_id, repo_path)
+                # Only re-read what the chat wrote, unless a command may have changed other files
+                if written_files and not ran_commands:
+                    updated_live = await asyncio.to_thread(update_run_files, req.run_id, repo_path, written_files)
+                if updated_live is None:
+                    updated_live = await asyncio.to_thread(refresh_run_files, req.run_id, repo_path)
 
         payload = {
             "response": final_response.strip(),
@@ -977,11 +1249,11 @@ async def chat_with_agent(req: ChatRequest):
 @app.get("/chat/history/{run_id}")
 async def get_chat_history(run_id: str, session_id: str = "default"):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT role, content, timestamp FROM chat_messages WHERE run_id = ? AND session_id = ? ORDER BY timestamp ASC", (run_id, session_id))
-        rows = c.fetchall()
-        conn.close()
+        rows = await asyncio.to_thread(
+            _read_all,
+            "SELECT role, content, timestamp FROM chat_messages WHERE run_id = ? AND session_id = ? ORDER BY timestamp ASC",
+            (run_id, session_id),
+        )
 
         merged_history = []
         for r in rows:
@@ -1004,11 +1276,7 @@ async def get_chat_history(run_id: str, session_id: str = "default"):
 @app.get("/chat/sessions/{run_id}")
 async def get_chat_sessions(run_id: str):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT DISTINCT session_id FROM chat_messages WHERE run_id = ?", (run_id,))
-        rows = c.fetchall()
-        conn.close()
+        rows = await asyncio.to_thread(_read_all, "SELECT DISTINCT session_id FROM chat_messages WHERE run_id = ?", (run_id,))
         sessions = [r[0] for r in rows if r[0]]
         if "default" not in sessions: sessions.insert(0, "default")
         return {"sessions": sessions}
@@ -1021,20 +1289,16 @@ async def delete_chat_session(run_id: str, session_id: str):
     if session_id == "default":
         raise HTTPException(status_code=400, detail="Cannot delete default session")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("DELETE FROM chat_messages WHERE run_id = ? AND session_id = ?", (run_id, session_id))
-        conn.commit()
-        conn.close()
+        await asyncio.to_thread(_execute, "DELETE FROM chat_messages WHERE run_id = ? AND session_id = ?", (run_id, session_id))
 
         repo_path = get_repo_path(run_id)
         if repo_path and repo_path.exists():
             history_file = repo_path / ".gguai" / "chat_history.json"
             if history_file.exists():
                 try:
-                    history = json.loads(history_file.read_text(encoding="utf-8"))
+                    history = orjson.loads(history_file.read_bytes())
                     new_history = [m for m in history if m.get("session_id", "default") != session_id]
-                    history_file.write_text(json.dumps(new_history, indent=2), encoding="utf-8")
+                    history_file.write_bytes(orjson.dumps(new_history, option=orjson.OPT_INDENT_2))
                 except:
                     pass
         return {"status": "success", "message": f"Deleted session {session_id}"}
@@ -1052,17 +1316,11 @@ async def get_results(run_id: str):
         repo_path = RUN_PATHS.get(run_id)
         if repo_path and repo_path.exists():
             from git_utils import get_all_files
-            from git import Repo
             try:
                 # We handle both real git repos and local folders (MockRepo)
-                try:
-                    repo_obj = Repo(repo_path)
-                except:
-                    class MockRepo:
-                        def __init__(self, p): self.working_dir = str(p)
-                    repo_obj = MockRepo(repo_path)
-                
-                run.setdefault("live", {})["files"] = get_all_files(repo_obj)
+                files = get_all_files(open_repo(run_id, repo_path))
+                with run_lock(run_id):
+                    run.setdefault("live", {})["files"] = files
             except Exception as e:
                 logger.warning(f"Auto-refresh files failed for {run_id}: {e}")
 
@@ -1074,7 +1332,7 @@ async def get_results(run_id: str):
         "team_name": run.get("team_name"),
         "leader_name": run.get("leader_name"),
         "started_at": run.get("started_at"),
-        "live": run.get("live", {}),
+        "live": {**run.get("live", {}), "terminal_output": terminal_text(run_id)},
         "result": run.get("result"),
         "error": run.get("error"),
     }
@@ -1102,6 +1360,7 @@ async def list_workspaces():
 async def manual_save():
     """Manually trigger project state persistence."""
     save_projects()
+    await asyncio.to_thread(flush_projects)
     return {"status": "success", "message": "Workspaces persisted to disk"}
 
 @app.get("/config")
@@ -1116,11 +1375,16 @@ async def get_config():
 @app.post("/config")
 async def update_config(conf: ConfigUpdate):
     env_path = Path(__file__).parent / ".env"
-    lines = env_path.read_text().splitlines() if env_path.exists() else []
     updates = {}
     if conf.github_pat: updates["GITHUB_PAT"] = conf.github_pat
     if conf.nvidia_api_key: updates["NVIDIA_API_KEY"] = conf.nvidia_api_key
-    
+    await asyncio.to_thread(_update_env_file, env_path, updates)
+    for key, val in updates.items(): os.environ[key] = val
+    return {"message": "Config updated"}
+
+def _update_env_file(env_path: Path, updates: dict):
+    """Rewrite KEY=value lines in .env for *updates*, appending keys that are missing."""
+    lines = env_path.read_text().splitlines() if env_path.exists() else []
     new_lines = []
     seen = set()
     for line in lines:
@@ -1134,23 +1398,51 @@ async def update_config(conf: ConfigUpdate):
     for key, val in updates.items():
         if key not in seen: new_lines.append(f"{key}={val}")
     env_path.write_text("\n".join(new_lines) + "\n")
-    for key, val in updates.items(): os.environ[key] = val
-    return {"message": "Config updated"}
 
 @app.get("/repos")
 async def list_repos():
+    # iterdir + per-file stat of every clone is blocking I/O
+    return await asyncio.to_thread(_list_repos_sync)
+
+_dir_size_cache: dict[tuple[str, int], int] = {}   # (clone dir, its st_mtime_ns) -> total bytes
+
+def _dir_size(root: str) -> int:
+    """Total size of regular files under *root* (os.scandir walk; symlinks not followed)."""
+    total = 0
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
+
+def _list_repos_sync():
     clones_dir = CLONES_DIR
     if not clones_dir.exists():
         clones_dir.mkdir(parents=True, exist_ok=True)
         return []
     repo_list = []
     for item in clones_dir.iterdir():
-        if item.is_dir():
+        # Dot-dirs are clones being deleted in the background (.trash-*)
+        if item.is_dir() and not item.name.startswith("."):
             run_id = item.name.split("_")[0]
             repo_name = item.name.replace(f"{run_id}_", "")
             try:
                 stat_info = item.stat()
-                total_size = sum(f.stat().st_size for f in item.rglob('*') if f.is_file())
+                # Keyed on the top-level mtime: skips the walk while the clone's root is unchanged
+                size_key = (str(item), stat_info.st_mtime_ns)
+                total_size = _dir_size_cache.get(size_key)
+                if total_size is None:
+                    total_size = _dir_size_cache[size_key] = _dir_size(str(item))
                 repo_list.append({
                     "run_id": run_id,
                     "repo_name": repo_name,
@@ -1164,19 +1456,26 @@ async def list_repos():
 
 @app.delete("/repos/{run_id}")
 async def delete_repo(run_id: str):
-    clones_dir = CLONES_DIR
-    target = next((item for item in clones_dir.iterdir() if item.is_dir() and item.name.split('_')[0] == run_id), None) if clones_dir.exists() else None
+    # Rescan once on a miss: the folder may have been added outside this process
+    target = _clone_dir(run_id) or _scan_clone_dirs().get(run_id)
     if target:
         try:
             def on_rm_error(func, path, exc_info):
-                import stat
                 try:
                     os.chmod(path, stat.S_IWRITE)
                     func(path)
                 except Exception: pass
-            shutil.rmtree(target, onerror=on_rm_error)
-            zip_p = Path(__file__).parent / "downloads" / f"fixed_{run_id}.zip"
-            if zip_p.exists(): os.remove(zip_p)
+            await asyncio.to_thread(release_sandbox, target)
+            forget_cached_files(target)
+            await asyncio.to_thread(shutil.rmtree, target, onerror=on_rm_error)
+            _clone_dirs.pop(run_id, None)
+            RUN_PATHS_RESOLVED.pop(run_id, None)
+            _resolve_cwd.cache_clear()
+            _cwd_state.pop(run_id, None)
+            _repo_cache.pop(run_id, None)
+            for zip_p in ZIP_CACHE_DIR.glob(f"project_{run_id}_*.zip"):
+                try: zip_p.unlink()
+                except OSError: pass
             return {"message": f"Deleted {run_id}"}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
@@ -1189,11 +1488,10 @@ async def save_file(req: SaveFileRequest):
     
     full_p = (target / req.file_path).resolve()
     # Path safety: Ensure we are inside the project
-    if not str(full_p).startswith(str(target.resolve())): 
+    if not str(full_p).startswith(str(_resolved_root(req.run_id, target))): 
         raise HTTPException(status_code=403, detail="Illegal path traversal attempt")
         
-    full_p.parent.mkdir(parents=True, exist_ok=True)
-    full_p.write_text(req.content, encoding="utf-8")
+    await _awrite_text(full_p, req.content)
     logger.info(f"[API] Saved file: {req.file_path} for run: {req.run_id}")
     return {"message": "Saved"}
 
@@ -1204,18 +1502,17 @@ async def create_item(req: CreateItemRequest):
     
     rel_p = f"{req.parent_path}/{req.name}" if req.parent_path else req.name
     full_p = (target / rel_p).resolve()
-    if not str(full_p).startswith(str(target.resolve())): 
+    if not str(full_p).startswith(str(_resolved_root(req.run_id, target))): 
         raise HTTPException(status_code=403, detail="Illegal path traversal attempt")
     try:
         if req.type == "folder": 
-            full_p.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(full_p.mkdir, parents=True, exist_ok=True)
             logger.info(f"[API] Created folder: {rel_p} for run: {req.run_id}")
         else:
-            full_p.parent.mkdir(parents=True, exist_ok=True)
             if not full_p.exists(): 
-                full_p.write_text("", encoding="utf-8")
+                await _awrite_text(full_p, "")
                 logger.info(f"[API] Created empty file: {rel_p} for run: {req.run_id}")
-        updated_live = refresh_run_files(req.run_id, target)
+        updated_live = await asyncio.to_thread(refresh_run_files, req.run_id, target)
         return {"message": "Created", "files": updated_live}
     except Exception as e: 
         logger.error(f"[API] Failed to create {req.type} {rel_p}: {e}")
@@ -1227,16 +1524,16 @@ async def delete_item(req: DeleteItemRequest):
     if not target: raise HTTPException(status_code=404, detail="Project path not found")
     
     full_p = (target / req.path).resolve()
-    if not str(full_p).startswith(str(target.resolve())): 
+    if not str(full_p).startswith(str(_resolved_root(req.run_id, target))): 
         raise HTTPException(status_code=403, detail="Illegal path traversal attempt")
         
     try:
         if full_p.is_dir():
-            shutil.rmtree(full_p)
+            await asyncio.to_thread(shutil.rmtree, full_p)
         elif full_p.is_file():
             full_p.unlink()
             
-        updated_live = refresh_run_files(req.run_id, target)
+        updated_live = await asyncio.to_thread(refresh_run_files, req.run_id, target)
         return {"message": "Deleted", "files": updated_live}
     except Exception as e: raise HTTPException(status_code=500, detail=str(e))
 
@@ -1258,13 +1555,13 @@ async def rename_item(req: RenameItemRequest):
 
     src = (target / req.old_path).resolve()
     dest = src.parent / req.new_name
-    if not str(src).startswith(str(target.resolve())):
+    if not str(src).startswith(str(_resolved_root(req.run_id, target))):
         raise HTTPException(status_code=403, detail="Illegal path traversal attempt")
     if dest.exists():
         raise HTTPException(status_code=400, detail=f"'{req.new_name}' already exists")
     try:
         src.rename(dest)
-        updated_live = refresh_run_files(req.run_id, target)
+        updated_live = await asyncio.to_thread(refresh_run_files, req.run_id, target)
         return {"message": "Renamed", "files": updated_live}
     except Exception as e: raise HTTPException(status_code=500, detail=str(e))
 
@@ -1275,22 +1572,30 @@ async def copy_item(req: CopyItemRequest):
 
     src = (target / req.src_path).resolve()
     dest = (target / req.dest_path).resolve()
-    if not str(src).startswith(str(target.resolve())) or not str(dest).startswith(str(target.resolve())):
+    root = str(_resolved_root(req.run_id, target))
+    if not str(src).startswith(root) or not str(dest).startswith(root):
         raise HTTPException(status_code=403, detail="Illegal path traversal attempt")
     try:
         dest.parent.mkdir(parents=True, exist_ok=True)
         if req.move:
-            shutil.move(str(src), str(dest))
+            await asyncio.to_thread(shutil.move, str(src), str(dest))
         elif src.is_dir():
-            shutil.copytree(str(src), str(dest))
+            await asyncio.to_thread(shutil.copytree, str(src), str(dest))
         else:
-            shutil.copy2(str(src), str(dest))
-        updated_live = refresh_run_files(req.run_id, target)
+            await asyncio.to_thread(shutil.copy2, str(src), str(dest))
+        updated_live = await asyncio.to_thread(refresh_run_files, req.run_id, target)
         return {"message": "Moved" if req.move else "Copied", "files": updated_live}
     except Exception as e: raise HTTPException(status_code=500, detail=str(e))
 
 
 
+# Output/error text goes out as binary frames (1-byte type tag + UTF-8) to skip JSON
+# encoding and escaping; control messages such as "done" stay JSON
+_WS_TAGS = {"output": b"\x01", "error": b"\x02"}
+
+def _terminal_frame(msg_type: str, content: str) -> bytes:
+    return _WS_TAGS[msg_type] + content.encode("utf-8")
+
 @app.websocket("/ws/terminal/{run_id}")
 async def terminal_websocket(websocket: WebSocket, run_id: str):
     """Handle real-time interactive terminal with stdin support."""
@@ -1301,67 +1606,69 @@ async def terminal_websocket(websocket: WebSocket, run_id: str):
     if not repo_root:
         logger.warning(f"[WS] Project not found for run_id: '{run_id}'. Available keys in RUN_PATHS: {list(RUN_PATHS.keys())}")
         try:
-            await websocket.send_json({"type": "error", "content": f"Project not found for run_id: {run_id}"})
+            await websocket.send_bytes(_terminal_frame("error", f"Project not found for run_id: {run_id}"))
             await websocket.close()
         except: pass
         return
     
     logger.info(f"[WS] Resolved repo_root for '{run_id}': {repo_root}")
 
-    loop = asyncio.get_running_loop()
     logger.info(f"[WS] Session active: {run_id}")
 
     # Send existing history
-    if run_id in runs and "live" in runs[run_id]:
-        history = runs[run_id]["live"].get("terminal_output", "")
-        if history:
-            try: await websocket.send_json({"type": "output", "content": history[-10000:]})
-            except: pass
+    history = terminal_text(run_id)
+    if history:
+        try: await websocket.send_bytes(_terminal_frame("output", history))
+        except: pass
 
     # State for the current interactive process
     active_process = None
     output_queue = asyncio.Queue()
     current_cwd = str(repo_root)
 
-    def pipe_reader(pipe, msg_type):
-        """Read from a pipe and push to output_queue."""
-        try:
-            while True:
-                char = pipe.read(1)
-                if not char:
-                    break
-                loop.call_soon_threadsafe(output_queue.put_nowait, {"type": msg_type, "content": char})
-        except Exception:
-            pass
+    async def pump(stream: asyncio.StreamReader, msg_type: str):
+        """Read a process stream and push its text to output_queue."""
+        # read() returns whatever is available (up to 64 KiB), so prompts without a
+        # trailing newline still show up immediately; the decoder keeps split UTF-8 intact
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            text = decoder.decode(chunk)
+            if text:
+                output_queue.put_nowait({"type": msg_type, "content": text})
+        text = decoder.decode(b"", final=True)
+        if text:
+            output_queue.put_nowait({"type": msg_type, "content": text})
 
     async def drain_output():
         """Drain output_queue and send to websocket continuously for the life of the connection."""
-        nonlocal active_process
-        buffer = ""
         try:
             while True:
-                try:
-                    # Wait for output from readers
-                    msg = await asyncio.wait_for(output_queue.get(), timeout=0.1)
-                    content = msg.get("content", "")
-                    buffer += content
-                    
-                    # Flush on newline or limit
-                    if "\n" in buffer or "\r" in buffer or len(buffer) > 200:
-                        if run_id in runs:
-                            old = runs[run_id]["live"].get("terminal_output", "")
-                            runs[run_id]["live"]["terminal_output"] = (old + buffer)[-30000:]
-                        await websocket.send_json({"type": msg["type"], "content": buffer})
-                        buffer = ""
-                except asyncio.TimeoutError:
-                    # Periodic flush
-                    if buffer:
-                        if run_id in runs:
-                            old = runs[run_id]["live"].get("terminal_output", "")
-                            runs[run_id]["live"]["terminal_output"] = (old + buffer)[-30000:]
-                        await websocket.send_json({"type": "output", "content": buffer})
-                        buffer = ""
-                    # We NO LONGER break here when process ends. We wait for more output from potentially NEW processes.
+                # Block until something arrives, then take everything else already queued
+                batch = [await output_queue.get()]
+                while True:
+                    try: batch.append(output_queue.get_nowait())
+                    except asyncio.QueueEmpty: break
+
+                # One frame per run of same-typed output, instead of one per read;
+                # control messages ("done") are passed through in order
+                frames = []
+                for msg in batch:
+                    if msg["type"] not in ("output", "error"):
+                        frames.append(msg)
+                    elif frames and isinstance(frames[-1], tuple) and frames[-1][0] == msg["type"]:
+                        frames[-1][1].append(msg["content"])
+                    else:
+                        frames.append((msg["type"], [msg["content"]]))
+                for frame in frames:
+                    if isinstance(frame, dict):
+                        await websocket.send_json(frame)
+                        continue
+                    content = "".join(frame[1])
+                    append_terminal_output(run_id, content)
+                    await websocket.send_bytes(_terminal_frame(frame[0], content))
         except asyncio.CancelledError:
             pass
         except Exception as e:
@@ -1374,39 +1681,28 @@ async def terminal_websocket(websocket: WebSocket, run_id: str):
             chained_cmd = f"chcp 65001 >nul 2>&1 & cd /d \"{start_dir}\" & {cmd}"
             logger.info(f"[WS] Executing: {chained_cmd}")
 
-            active_process = subprocess.Popen(
+            proc = active_process = await asyncio.create_subprocess_shell(
                 chained_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                shell=True,
-                text=True,
-                encoding="utf-8",
-                errors="replace",
-                bufsize=0,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                stdin=asyncio.subprocess.PIPE,
                 cwd=str(start_dir),
                 creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
             )
 
-            # Start readers
-            threading.Thread(target=pipe_reader, args=(active_process.stdout, "output"), daemon=True).start()
-            threading.Thread(target=pipe_reader, args=(active_process.stderr, "error"), daemon=True).start()
-
-            # Wait for completion (blocking in a thread or using communicate)
-            # Since we have readers, we just need to wait for the return code
-            exit_code = active_process.wait()
-            
-            # Small delay to allow readers to finish putting everything in the queue
-            await asyncio.sleep(0.5)
+            # Both streams are pumped on the event loop; wait() returns once the process exits
+            *_, exit_code = await asyncio.gather(pump(proc.stdout, "output"), pump(proc.stderr, "error"), proc.wait())
             
-            await websocket.send_json({"type": "done", "exit_code": exit_code, "cwd": str(start_dir)})
+            # Queued behind the pumps' output, so the drainer sends it only after all of it
+            output_queue.put_nowait({"type": "done", "exit_code": exit_code, "cwd": str(start_dir)})
             save_projects()
         except asyncio.CancelledError:
-            if active_process and active_process.poll() is None:
-                active_process.kill()
+            if active_process and active_process.returncode is None:
+                try: active_process.kill()
+                except ProcessLookupError: pass
         except Exception as e:
             logger.warning(f"[WS] Command task error: {e}")
-            await websocket.send_json({"type": "error", "content": str(e)})
+            await websocket.send_bytes(_terminal_frame("error", str(e)))
 
     try:
         # Start the persistent drainer task
@@ -1423,28 +1719,27 @@ async def terminal_websocket(websocket: WebSocket, run_id: str):
                 stdin_data = data.get("data", "")
                 # Special case: \x03 is Ctrl+C
                 if stdin_data == '\x03':
-                    if active_process and active_process.poll() is None:
-                        active_process.kill()
-                        await websocket.send_json({"type": "output", "content": "^C\n"})
+                    if active_process and active_process.returncode is None:
+                        try: active_process.kill()
+                        except ProcessLookupError: pass
+                        await websocket.send_bytes(_terminal_frame("output", "^C\n"))
                     continue
 
-                if active_process and active_process.poll() is None and active_process.stdin:
+                if active_process and active_process.returncode is None and active_process.stdin:
                     try:
                         if not stdin_data.endswith("\n") and not stdin_data.endswith("\r"):
                             if len(stdin_data) == 1 and ord(stdin_data[0]) < 32: pass
                             else: stdin_data += "\n"
                         
-                        active_process.stdin.write(stdin_data)
-                        active_process.stdin.flush()
+                        active_process.stdin.write(stdin_data.encode("utf-8"))
+                        await active_process.stdin.drain()
                         
-                        if run_id in runs:
-                            old = runs[run_id]["live"].get("terminal_output", "")
-                            runs[run_id]["live"]["terminal_output"] = (old + stdin_data)[-30000:]
-                        await websocket.send_json({"type": "output", "content": stdin_data})
+                        append_terminal_output(run_id, stdin_data)
+                        await websocket.send_bytes(_terminal_frame("output", stdin_data))
                     except Exception as e:
-                        await websocket.send_json({"type": "error", "content": f"stdin error: {e}"})
+                        await websocket.send_bytes(_terminal_frame("error", f"stdin error: {e}"))
                 else:
-                    await websocket.send_json({"type": "error", "content": "No active process."})
+                    await websocket.send_bytes(_terminal_frame("error", "No active process."))
                 continue
 
             # ── Handle new command ──────────────────────────────────
@@ -1456,23 +1751,22 @@ async def terminal_websocket(websocket: WebSocket, run_id: str):
             cwd = data.get("cwd") or current_cwd
             try:
                 start_dir = Path(cwd)
-                if not str(start_dir.resolve()).startswith(str(repo_root.resolve())):
+                if not _resolve_cwd(str(start_dir)).startswith(str(_resolved_root(run_id, repo_root))):
                     start_dir = repo_root
             except Exception:
                 start_dir = repo_root
 
             # Kill existing
-            if active_process and active_process.poll() is None:
-                active_process.kill()
-                active_process.wait()
+            if active_process and active_process.returncode is None:
+                try: active_process.kill()
+                except ProcessLookupError: pass
+                await active_process.wait()
             if current_cmd_task and not current_cmd_task.done():
                 current_cmd_task.cancel()
 
             prompt_line = f"\n{start_dir}> {command}\n"
-            if run_id in runs:
-                old = runs[run_id]["live"].get("terminal_output", "")
-                runs[run_id]["live"]["terminal_output"] = (old + prompt_line)[-30000:]
-            await websocket.send_json({"type": "output", "content": prompt_line})
+            append_terminal_output(run_id, prompt_line)
+            await websocket.send_bytes(_terminal_frame("output", prompt_line))
 
             # Start the command in the background
             current_cmd_task = asyncio.create_task(run_command_task(command, start_dir))
@@ -1483,15 +1777,43 @@ async def terminal_websocket(websocket: WebSocket, run_id: str):
         logger.warning(f"[WS] WebSocket Loop Error: {e}")
     finally:
         # Cleanup
-        if active_process and active_process.poll() is None:
-            try: active_process.kill()
-            except: pass
         if 'drain_task' in locals():
             drain_task.cancel()
         if 'current_cmd_task' in locals() and current_cmd_task:
             current_cmd_task.cancel()
         save_projects()
+        if active_process and active_process.returncode is None:
+            try:
+                active_process.kill()
+                # Reap it on the loop (bounded) so its pipes and transport are closed
+                await asyncio.wait_for(active_process.wait(), timeout=5)
+            except Exception: pass
+
 
+_cwd_state: dict[str, Path] = {}   # run_id -> working dir of the /terminal session
+
+def _direct_argv(command: str) -> list[str] | None:
+    """argv to run *command* without a shell, or None if it needs one (syntax, builtins, .bat/.cmd)."""
+    if _SHELL_META_RE.search(command):
+        return None
+    argv = command.split()
+    exe = shutil.which(argv[0]) if argv else None
+    if not exe or exe.lower().endswith((".bat", ".cmd")):
+        return None
+    return [exe, *argv[1:]]
+
+def _change_dir(run_id: str, start_dir: Path, repo_root: Path | None, arg: str) -> tuple[str, int]:
+    """Apply a terminal "cd" to _cwd_state; returns (error message, exit code)."""
+    if not arg:
+        _cwd_state[run_id] = start_dir
+        return "", 0
+    target = _resolve_cwd(str(start_dir / arg))
+    if not os.path.isdir(target):
+        return "The system cannot find the path specified.", 1
+    if repo_root and not target.startswith(str(_resolved_root(run_id, repo_root))):
+        return "Cannot cd outside the project directory.", 1
+    _cwd_state[run_id] = Path(target)
+    return "", 0
 
 @app.post("/terminal")
 async def execute_terminal_command(req: TerminalRequest):
@@ -1499,38 +1821,33 @@ async def execute_terminal_command(req: TerminalRequest):
     repo_root = get_repo_path(req.run_id)
     
     if repo_root:
-        start_dir = Path(req.cwd) if req.cwd else repo_root
+        start_dir = Path(req.cwd) if req.cwd else _cwd_state.get(req.run_id, repo_root)
         # Path Safety: Ensure we don't 'cd' out of the project boundaries
-        if not str(start_dir.resolve()).startswith(str(repo_root.resolve())):
+        if not _resolve_cwd(str(start_dir)).startswith(str(_resolved_root(req.run_id, repo_root))):
             start_dir = repo_root
     else:
         # Global fallback if no project is active (allows basic commands in root)
-        start_dir = Path(req.cwd) if req.cwd else CLONES_DIR.resolve()
+        start_dir = Path(req.cwd) if req.cwd else _cwd_state.get(req.run_id, Path(_resolve_cwd(str(CLONES_DIR))))
         if not start_dir.exists(): start_dir = Path.cwd()
+    _cwd_state[req.run_id] = start_dir
 
-    import subprocess
-    # start_dir is already resolved above based on project context or fallback
+    command = req.command.strip()
     try:
-        # Use '&' instead of '&&' so that the second command (cd) ALWAYS runs even if the first fails.
-        # This ensures we always get the new CWD back to the frontend.
-        chained_cmd = f"cd /d \"{start_dir}\" & {req.command} & echo --END_OF_COMMAND-- & cd"
-        
-        process = subprocess.run(
-            chained_cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=30,
-            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
-        )
-        
-        full_output = process.stdout
-        error = process.stderr
-        
-        # Split output to find the new CWD
-        parts = full_output.split("--END_OF_COMMAND--")
-        output = parts[0].strip()
-        new_cwd = parts[1].strip() if len(parts) > 1 else str(start_dir)
+        cd = _CD_RE.match(command)
+        cd_arg = cd.group(1).strip().strip('"') if cd and cd.group(1) else ""
+        if cd and not _SHELL_META_RE.search(cd_arg):
+            # The working dir is tracked here, so a cd needs no process at all
+            output, error, exit_code = "", *_change_dir(req.run_id, start_dir, repo_root, cd_arg)
+        else:
+            argv = _direct_argv(command)
+            process = await _run_process(
+                argv or command,
+                shell=argv is None,
+                cwd=str(start_dir),
+                timeout=30,
+            )
+            output, error, exit_code = process.stdout.strip(), process.stderr, process.returncode
+        new_cwd = str(_cwd_state[req.run_id])
         
         if error and not output:
              output = f"Error: Command execution returned non-zero status.\n{error}"
@@ -1538,54 +1855,191 @@ async def execute_terminal_command(req: TerminalRequest):
         # Sync manual command output to the live terminal_output for UI consistency
         if req.run_id in runs:
             # Append prompt indicator and command, then output
-            prompt = f"\n{new_cwd}> {req.command}\n"
-            current_output = runs[req.run_id]["live"].get("terminal_output", "")
-            runs[req.run_id]["live"]["terminal_output"] = (current_output + prompt + output + "\n")[-20000:]
+            prompt = f"\n{start_dir}> {req.command}\n"
+            append_terminal_output(req.run_id, prompt + output + "\n")
             save_projects()
 
         return {
             "output": output,
-            "error": error if process.returncode != 0 else "",
-            "exit_code": process.returncode,
+            "error": error if exit_code != 0 else "",
+            "exit_code": exit_code,
             "cwd": new_cwd
         }
     except Exception as e:
         logger.error(f"[TERMINAL] Command failed: {e}")
         return {"output": "", "error": f"Internal Shell Error: {str(e)}", "exit_code": 1, "cwd": str(start_dir)}
 
+ZIP_CHUNK_SIZE = 1 << 20   # bytes read from a file / yielded to the client at a time
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable write target for zipfile; the download generator drains it as it goes."""
+    def __init__(self):
+        super().__init__()
+        self._buf = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buf += b
+        return len(b)
+
+    def take(self, min_size: int = 0) -> bytes:
+        """Return and clear the buffered bytes, or b"" while fewer than *min_size* are buffered."""
+        if len(self._buf) < min_size:
+            return b""
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+def _zip_member(zipf: zipfile.ZipFile, sink: _ZipSink, file_p: Path, zinfo: zipfile.ZipInfo):
+    """Stream one member through zipfile in chunks and yield the bytes produced."""
+    try:
+        with open(file_p, 'rb') as src, zipf.open(zinfo, 'w') as dst:
+            while chunk := src.read(ZIP_CHUNK_SIZE):
+                dst.write(chunk)
+                if data := sink.take(ZIP_CHUNK_SIZE): yield data
+    except OSError:
+        pass
+    # Small members accumulate until a full chunk is ready: each yield is a threadpool
+    # hop and a socket write in StreamingResponse
+    if data := sink.take(ZIP_CHUNK_SIZE): yield data
+
+def _iter_zip_files(target: Path):
+    """
+    Yield (DirEntry, arcname) for files under *target*, pruning _ZIP_SKIP_DIRS.
+    scandir's cached entry type avoids the extra stat per entry that os.walk needs.
+    """
+    stack = [(str(target), "")]
+    while stack:
+        path, prefix = stack.pop()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in _ZIP_SKIP_DIRS:
+                        stack.append((entry.path, f"{prefix}{entry.name}/"))
+                elif not _ZIP_SKIP_FILE_RE.search(entry.name):
+                    yield entry, prefix + entry.name
+
+def _zip_info(arcname: str, st: os.stat_result) -> zipfile.ZipInfo:
+    """ZipInfo.from_file without its own stat (pre-1980 mtimes are clamped instead of raising)."""
+    date_time = time.localtime(st.st_mtime)[:6]
+    if date_time[0] < 1980:
+        date_time = (1980, 1, 1, 0, 0, 0)
+    zinfo = zipfile.ZipInfo(arcname, date_time)
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.file_size = st.st_size
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    return zinfo
+
+def _zip_members(target: Path) -> list[tuple[str, str, os.stat_result]]:
+    """Regular files to archive from *target* as (path, arcname, stat), sorted by arcname."""
+    members = []
+    for entry, arcname in _iter_zip_files(target):
+        try:
+            st = entry.stat()
+        except OSError: continue
+        # Symlinks to dirs and other non-regular files are left out, as os.walk did
+        if stat.S_ISREG(st.st_mode):
+            members.append((entry.path, arcname, st))
+    members.sort(key=lambda m: m[1])
+    return members
+
+def _tree_digest(members: list[tuple[str, str, os.stat_result]]) -> str:
+    """Cache key for an archive: changes whenever a member is added, removed, resized or touched."""
+    digest = hashlib.blake2b(digest_size=16)
+    for _, arcname, st in members:
+        digest.update(f"{arcname}|{st.st_mtime_ns}|{st.st_size}\n".encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+def _iter_project_zip(members: list[tuple[str, str, os.stat_result]]):
+    """Yield a ZIP of *members* (see _zip_members) as it is compressed, in order."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for path, arcname, st in members:
+            yield from _zip_member(zipf, sink, Path(path), _zip_info(arcname, st))
+    # Central directory, written when the archive closes
+    if data := sink.take(): yield data
+
+# Finished archives are kept as downloads/project_<run_id>_<tree digest>.zip, so a repeat
+# download of an unchanged tree is a stat-only walk plus a FileResponse
+ZIP_CACHE_DIR = Path(__file__).parent / "downloads"
+ZIP_CACHE_MAX = 8   # archives kept across all runs; least recently used are removed first
+
+def _evict_zip_cache(keep: Path):
+    """Drop other archives of *keep*'s run, then the least recently used beyond ZIP_CACHE_MAX."""
+    run_prefix = keep.name.rsplit("_", 1)[0] + "_"
+    cached = []
+    for p in ZIP_CACHE_DIR.glob("project_*.zip"):
+        try:
+            if p != keep and p.name.startswith(run_prefix):
+                p.unlink()
+            else:
+                cached.append((p.stat().st_mtime, p))
+        except OSError: continue
+    cached.sort(reverse=True)
+    for _, p in cached[ZIP_CACHE_MAX:]:
+        try: p.unlink()
+        except OSError: pass
+
+def _tee_to_cache(chunks, cache_path: Path):
+    """Pass *chunks* through while writing them to *cache_path*, kept only if the archive completes."""
+    tmp = cache_path.with_name(f"{cache_path.name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        with open(tmp, 'wb') as out:
+            for chunk in chunks:
+                out.write(chunk)
+                yield chunk
+        os.replace(tmp, cache_path)
+        _evict_zip_cache(cache_path)
+    finally:
+        try: tmp.unlink()
+        except OSError: pass
+
+def _prepare_download(run_id: str, target: Path):
+    """Return (cached archive or None, members, cache path) for a download of *target*."""
+    members = _zip_members(target)
+    ZIP_CACHE_DIR.mkdir(exist_ok=True)
+    cache_path = ZIP_CACHE_DIR / f"project_{run_id}_{_tree_digest(members)}.zip"
+    if cache_path.exists():
+        os.utime(cache_path)   # mark as recently used for _evict_zip_cache
+        return cache_path, members, cache_path
+    return None, members, cache_path
+
 @app.get("/download/{run_id}")
-async def download_fixed_code(run_id: str, background_tasks: BackgroundTasks):
+async def download_fixed_code(run_id: str):
     target = get_repo_path(run_id)
     if not target: raise HTTPException(status_code=404, detail="Project not found")
-    
-    zip_root = Path(__file__).parent / "downloads"
-    zip_root.mkdir(exist_ok=True)
-    # Use unique filename to avoid "File in use" errors
-    zip_filename = f"project_{run_id}_{int(time.time())}.zip"
-    zip_full_path = zip_root / zip_filename
-    
-    try:
-        with zipfile.ZipFile(zip_full_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(target):
-                if '.git' in dirs: dirs.remove('.git')
-                for file in files:
-                    file_p = Path(root) / file
-                    try: zipf.write(file_p, file_p.relative_to(target))
-                    except: continue
-        
-        # Cleanup background task
-        background_tasks.add_task(os.remove, str(zip_full_path))
-        
-        return FileResponse(
-            path=zip_full_path,
-            filename=f"project_{run_id}.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        if zip_full_path.exists():
-            try: os.remove(zip_full_path)
-            except: pass
-        raise HTTPException(status_code=500, detail=str(e))
+
+    cached, members, cache_path = await asyncio.to_thread(_prepare_download, run_id, target)
+    if cached:
+        return FileResponse(path=cached, filename=f"project_{run_id}.zip", media_type="application/zip")
+
+    # Compressed straight into the response (the sync generator runs in Starlette's
+    # threadpool) and written to the cache as it goes
+    return StreamingResponse(
+        _tee_to_cache(_iter_project_zip(members), cache_path),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="project_{run_id}.zip"'},
+    )
+
+# ---------------------------------------------------------------------------
+# Server options (shared by run_backend.py)
+# ---------------------------------------------------------------------------
+# uvloop and the httptools parser come with uvicorn[standard] except on Windows,
+# where the default asyncio (Proactor) loop is needed for subprocess pipes
+SERVER_OPTIONS = {
+    "loop": "uvloop" if sys.platform != "win32" and importlib.util.find_spec("uvloop") else "asyncio",
+    "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+    "ws": "websockets",
+    "ws_max_size": 16 * 1024 * 1024,
+    # Terminal frames go to a local UI; compressing each one costs more CPU than it saves
+    "ws_per_message_deflate": False,
+}
 
 # ---------------------------------------------------------------------------
 # State Initialization
@@ -1595,5 +2049,5 @@ load_projects(import_chat_history)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=False)
+    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=False, **SERVER_OPTIONS)
 
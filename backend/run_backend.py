@@ -13,11 +13,11 @@ load_dotenv(current_dir / ".env")
 
 # Import the FastAPI app
 try:
-    from main import app
+    from main import app, SERVER_OPTIONS
 except ImportError as e:
     print(f"Error importing app: {e}")
     sys.exit(1)
 
 if __name__ == "__main__":
     print("Starting CI/CD Healing Agent Backend...")
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info", **SERVER_OPTIONS)
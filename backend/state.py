@@ -1,8 +1,11 @@
-import json
 import logging
 from pathlib import Path
 import os
 import sys
+import threading
+import time
+
+import orjson
 
 logger = logging.getLogger(__name__)
 
@@ -11,14 +14,89 @@ class RUN_PATHS_DICT(dict):
     def __setitem__(self, key, value):
         logger.info(f"[RUN_PATHS] SET {key} -> {value}")
         super().__setitem__(key, value)
+        # resolve() costs several stat/readlink calls; do it once per registration
+        RUN_PATHS_RESOLVED[key] = Path(value).resolve()
 
 runs = {}
+# runs is shared by pipeline threads, websocket handlers and chat requests:
+# RUNS_LOCK guards adding runs and iterating over them, run_lock(run_id) guards
+# read-modify-write updates of one run's "live" state (e.g. terminal_output appends)
+RUNS_LOCK = threading.RLock()
+_run_locks: dict[str, threading.Lock] = {}
+TERMINAL_OUTPUT_MAX = 30000   # bytes (UTF-8) of terminal_output kept per run
+RUN_PATHS_RESOLVED: dict[str, Path] = {}   # run_id -> resolved project root (path-safety checks)
 RUN_PATHS = RUN_PATHS_DICT()
 GLOBAL_CONFIG = {
     "github_pat": os.getenv("GITHUB_PAT", ""),
     "nvidia_api_key": os.getenv("NVIDIA_API_KEY", "")
 }
 
+def run_lock(run_id: str) -> threading.Lock:
+    """Return the lock for runs[run_id] (created on first use)."""
+    lock = _run_locks.get(run_id)
+    if lock is None:
+        with RUNS_LOCK:
+            lock = _run_locks.setdefault(run_id, threading.Lock())
+    return lock
+
+class TerminalBuffer:
+    """Fixed-size byte ring holding the last *limit* bytes (UTF-8) of a run's terminal output.
+
+    append() copies into a pre-allocated bytearray with wraparound, so the hot path never
+    reallocates; str() stitches the two halves together and decodes when the text is read.
+    Not thread-safe on its own: go through append_terminal_output / terminal_text.
+    """
+    __slots__ = ("_buf", "_head", "_filled", "limit")
+
+    def __init__(self, text: str = "", limit: int = TERMINAL_OUTPUT_MAX):
+        self._buf = bytearray(limit)
+        self._head = 0      # next write position
+        self._filled = 0    # bytes in use (== limit once wrapped)
+        self.limit = limit
+        self.append(text)
+
+    def append(self, text: str):
+        if not text:
+            return
+        data = memoryview(text.encode("utf-8"))[-self.limit:]
+        n, head = len(data), self._head
+        first = min(n, self.limit - head)
+        self._buf[head:head + first] = data[:first]
+        self._buf[:n - first] = data[first:]
+        self._head = (head + n) % self.limit
+        self._filled = min(self.limit, self._filled + n)
+
+    def __str__(self) -> str:
+        if self._filled < self.limit:
+            data = self._buf[:self._filled]
+        else:
+            data = self._buf[self._head:] + self._buf[:self._head]
+        # After a wrap the oldest bytes can start mid-character; that fragment is dropped
+        return data.decode("utf-8", errors="ignore")
+
+    def __len__(self) -> int:
+        return self._filled
+
+def append_terminal_output(run_id: str, text: str):
+    """Append *text* to a run's terminal_output buffer (the last TERMINAL_OUTPUT_MAX bytes are kept)."""
+    run = runs.get(run_id)
+    if run is None:
+        return
+    with run_lock(run_id):
+        live = run.setdefault("live", {})
+        buf = live.get("terminal_output")
+        if not isinstance(buf, TerminalBuffer):
+            buf = live["terminal_output"] = TerminalBuffer(buf or "")
+        buf.append(text)
+
+def terminal_text(run_id: str) -> str:
+    """Return a run's terminal_output as a plain string."""
+    run = runs.get(run_id)
+    if run is None:
+        return ""
+    with run_lock(run_id):
+        return str(run.get("live", {}).get("terminal_output", ""))
+
 # Paths
 if getattr(sys, 'frozen', False):
     APP_DATA = Path(os.getenv("APPDATA", os.path.expanduser("~"))) / "GGU AI-CICD-Healing-Agent"
@@ -31,7 +109,19 @@ DATA_DIR = ROOT_DIR / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 PROJECTS_FILE = DATA_DIR / "projects.json"
 
-def save_projects():
+def _runs_snapshot() -> list[tuple[str, dict]]:
+    with RUNS_LOCK:
+        return list(runs.items())
+
+SAVE_DEBOUNCE_SECONDS = 2.0   # save_projects() calls within this window share one write
+_save_pending = threading.Event()
+_save_worker: threading.Thread | None = None
+_save_worker_lock = threading.Lock()
+_write_lock = threading.Lock()   # worker and flush_projects() share one temp file
+_last_saved: bytes | None = None   # last payload written, so unchanged state is not rewritten
+
+def _save_projects_sync():
+    global _last_saved
     try:
         data = {
             "GLOBAL_CONFIG": GLOBAL_CONFIG,
@@ -41,18 +131,55 @@ def save_projects():
                     "team_name": v.get("team_name"),
                     "leader_name": v.get("leader_name"),
                     "status": v.get("status"),
-                    "terminal_output": v.get("live", {}).get("terminal_output", ""),
-                } for k, v in runs.items()
+                    "terminal_output": terminal_text(k),
+                } for k, v in _runs_snapshot()
             }
         }
-        PROJECTS_FILE.write_text(json.dumps(data), encoding="utf-8")
+        payload = orjson.dumps(data)
+        # Write a sibling temp file and swap it in so a crash never leaves half a JSON file
+        tmp = PROJECTS_FILE.with_name(PROJECTS_FILE.name + ".tmp")
+        with _write_lock:
+            if payload == _last_saved:
+                return
+            tmp.write_bytes(payload)
+            os.replace(tmp, PROJECTS_FILE)
+            _last_saved = payload
     except Exception as e:
         logger.warning(f"Failed to save projects: {e}")
 
+def _save_loop():
+    while True:
+        _save_pending.wait()
+        time.sleep(SAVE_DEBOUNCE_SECONDS)
+        _save_pending.clear()
+        _save_projects_sync()
+
+def save_projects():
+    """Schedule a write of projects.json; calls within SAVE_DEBOUNCE_SECONDS are coalesced."""
+    global _save_worker
+    if _save_worker is None:
+        with _save_worker_lock:
+            if _save_worker is None:
+                _save_worker = threading.Thread(target=_save_loop, name="save-projects", daemon=True)
+                _save_worker.start()
+    _save_pending.set()
+
+def flush_projects():
+    """Write projects.json now if a save is pending (shutdown, manual save)."""
+    if _save_pending.is_set():
+        _save_pending.clear()
+        _save_projects_sync()
+
+def _saved_terminal(value) -> str:
+    """projects.json stores terminal_output as a string; accept a list of chunks too."""
+    if isinstance(value, list):
+        return "".join(value)
+    return value or ""
+
 def load_projects(import_chat_history_callback=None):
     if PROJECTS_FILE.exists():
         try:
-            data = json.loads(PROJECTS_FILE.read_text(encoding="utf-8"))
+            data = orjson.loads(PROJECTS_FILE.read_bytes())
             
             # Load Global Config
             saved_config = data.get("GLOBAL_CONFIG", {})
@@ -78,7 +205,7 @@ def load_projects(import_chat_history_callback=None):
                     "live": {
                         "phase": "done",
                         "message": "Project restored",
-                        "terminal_output": v.get("terminal_output") or legacy_term,
+                        "terminal_output": TerminalBuffer(_saved_terminal(v.get("terminal_output")) or legacy_term),
                         "files": [],
                         "iterations": []
                     }
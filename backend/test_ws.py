@@ -9,7 +9,11 @@ async def test_terminal(run_id):
             print(f"Connected to {uri}")
             while True:
                 response = await websocket.recv()
-                data = json.loads(response)
+                if isinstance(response, bytes):
+                    # Binary frame: 1-byte type tag + UTF-8 text
+                    data = {"type": {1: "output", 2: "error"}.get(response[0], "output"), "content": response[1:].decode("utf-8")}
+                else:
+                    data = json.loads(response)
                 print(f"Received: {data}")
                 if data.get("type") == "error":
                     break
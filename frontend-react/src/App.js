@@ -72,11 +72,20 @@ export default function App() {
         // Connect WebSocket
         const WS_BASE = 'ws://127.0.0.1:8000';
         const ws = new WebSocket(`${WS_BASE}/ws/terminal/${runId}`);
+        ws.binaryType = 'arraybuffer';
         terminalWsRef.current = ws;
+        // Output/error text arrives as binary frames: 1-byte tag (1 = output, 2 = error) + UTF-8
+        const decoder = new TextDecoder();
+        const FRAME_TYPES = { 1: 'output', 2: 'error' };
 
         ws.onopen = () => appendTerminalLine('\n🔗 Terminal connected.\n', 'system');
         ws.onmessage = (event) => {
             try {
+                if (event.data instanceof ArrayBuffer) {
+                    const bytes = new Uint8Array(event.data);
+                    appendTerminalLine(decoder.decode(bytes.subarray(1)), FRAME_TYPES[bytes[0]] || 'output');
+                    return;
+                }
                 const msg = JSON.parse(event.data);
                 if (msg.type === 'output' || msg.type === 'error') {
                     appendTerminalLine(msg.content, msg.type);